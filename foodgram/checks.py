@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+# Эти бэкенды хранят данные в памяти одного процесса
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии справочников и страниц работают только в общем кэше."""
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'Кэш {backend} не общий для процессов.',
+        hint=('Изменение, сделанное в одном воркере gunicorn или в пуле '
+              'миниатюр, не сбросит справочники и страницы в остальных. '
+              'Задайте CACHE_BACKEND и CACHE_LOCATION (файловый кэш, '
+              'memcached, redis) или запускайте один процесс.'),
+        id='foodgram.W001')]
@@ -1,10 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
 from recipes.models import Purchase
 
 
 def counter(request):
     user = request.user
-    counter = Purchase.purchase.counter(
-        user) if user.is_authenticated else None
+    # Счетчик читается из базы, только если шаблон его выводит
+    counter = SimpleLazyObject(
+        lambda: Purchase.purchase.counter(user)
+    ) if user.is_authenticated else None
     return {
         'counter': counter,
     }
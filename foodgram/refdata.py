@@ -0,0 +1,136 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from threading import Lock
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import primary
+
+
+VERSION_KEY = 'refdata:{}:version'
+DATA_KEY = 'refdata:{}:{}'
+
+_registry = {}
+# Версии всех справочников, прочитанные в текущем запросе
+_versions = ContextVar('foodgram_refdata_versions', default=None)
+
+
+def _read_versions(names):
+    keys = {VERSION_KEY.format(name): name for name in names}
+    found = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Время, а не 1: после вытеснения ключа старые данные не оживут.
+        # Без срока: версия меняется только изменениями
+        now = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, now, None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def _current_version(name):
+    versions = _versions.get()
+    if versions is None:
+        return _read_versions([name]).get(name)
+    if name not in versions:
+        # Версии всех справочников читаются одним обращением к кэшу
+        versions.update(_read_versions(set(_registry) - set(versions)))
+    return versions.get(name)
+
+
+class RefData:
+    """
+    Справочник, который почти не меняется: теги, каталог продуктов, flatpages.
+
+    Данные хранятся в памяти процесса (L1) и в кэше Django (L2) под номером
+    версии. Номер лежит в кэше и увеличивается при каждом изменении; если
+    кэш общий (не LocMemCache, см. foodgram.checks), любой процесс замечает
+    изменение на следующем запросе и берет новые данные из кэша, а в базу
+    идет только первый заметивший процесс.
+    load возвращает данные для кэша, build строит из них структуру для
+    процесса (например, индекс).
+    """
+
+    def __init__(self, name, load, build=None):
+        self.name = name
+        self._load = load
+        self._build = build or (lambda data: data)
+        self._state = (None, None)
+        self._lock = Lock()
+        _registry[name] = self
+
+    def get(self):
+        version = _current_version(self.name)
+        if version is None:
+            # Кэш недоступен - читаем из базы
+            return self._build(self._load())
+        current, value = self._state
+        if current == version:
+            return value
+        with self._lock:
+            current, value = self._state
+            if current != version:
+                key = DATA_KEY.format(self.name, version)
+                data = cache.get(key)
+                if data is None:
+                    # Из реплики под новой версией сохранились бы старые
+                    # данные
+                    with primary():
+                        data = self._load()
+                    cache.set(key, data, settings.REFDATA_CACHE_TIMEOUT)
+                value = self._build(data)
+                self._state = (version, value)
+        return value
+
+    def _bump(self):
+        try:
+            cache.incr(VERSION_KEY.format(self.name))
+        except ValueError:
+            _read_versions([self.name])
+        versions = _versions.get()
+        if versions is not None:
+            versions.pop(self.name, None)
+
+    def invalidate(self):
+        # Второй сдвиг после коммита отбрасывает данные, которые другой
+        # процесс успел прочитать из базы до коммита
+        self._bump()
+        transaction.on_commit(self._bump)
+
+
+def invalidate_all():
+    for refdata in _registry.values():
+        refdata.invalidate()
+
+
+class RefDataMiddleware:
+    """Читает версии справочников не больше одного раза за запрос."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = _versions.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _versions.reset(token)
+
+    async def __acall__(self, request):
+        token = _versions.set({})
+        try:
+            return await self.get_response(request)
+        finally:
+            _versions.reset(token)
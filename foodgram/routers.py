@@ -0,0 +1,170 @@
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+# Служебные таблицы читаются только из основной базы, а запись в них
+# (сохранение сессии, миниатюры sorl) не закрепляет пользователя за ней
+PRIMARY_APPS = ('sessions', 'thumbnail')
+
+_state = ContextVar('foodgram_replica_state', default=None)
+_primary = ContextVar('foodgram_primary', default=False)
+
+
+class RequestState:
+    __slots__ = ('use_replica', 'pinned', 'wrote', 'used_replica')
+
+    def __init__(self, pinned):
+        self.use_replica = False
+        self.pinned = pinned
+        self.wrote = False
+        self.used_replica = False
+
+
+@contextmanager
+def primary():
+    """
+    Читает из основной базы, даже внутри представления с @read_replica.
+
+    Нужен там, где прочитанное попадает в долгоживущий кэш под уже
+    увеличенной версией: отставшая реплика сохранила бы в нем старые данные.
+    """
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+def used_replica():
+    """Читал ли текущий запрос что-нибудь из реплики."""
+    state = _state.get()
+    return state is not None and state.used_replica
+
+
+class ReplicaRouter:
+    """
+    Направляет чтение из представлений с @read_replica на реплики.
+
+    Все остальные запросы, любая запись и чтение пользователя, который
+    недавно что-то изменил, идут в основную базу (default).
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state is None or not state.use_replica or state.pinned
+                or state.wrote or _primary.get()
+                or model._meta.app_label in PRIMARY_APPS):
+            return None
+        state.used_replica = True
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_APPS:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+def read_replica(view):
+    """Разрешает представлению читать из реплики."""
+
+    def enter():
+        state = _state.get()
+        if state is not None:
+            state.use_replica = True
+        return state
+
+    def leave(state):
+        if state is not None:
+            state.use_replica = False
+
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            state = enter()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                leave(state)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = enter()
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                leave(state)
+
+    return wrapper
+
+
+class ReplicaPinMiddleware:
+    """
+    Закрепляет пользователя за основной базой после его изменений.
+
+    Если запрос что-то записал в базу, ответ ставит cookie на
+    REPLICA_PIN_SECONDS: пока она действует, чтение тоже идет в основную
+    базу, и пользователь сразу видит свои изменения, даже если реплика
+    отстает.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state = self._start(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = self._start(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(request, response, state)
+
+    def _start(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        return RequestState(pinned=pinned_until > time.time())
+
+    def _finish(self, request, response, state):
+        if state.wrote or request.method not in SAFE_METHODS:
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds,
+                httponly=True, samesite='Lax')
+        return response
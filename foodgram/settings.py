@@ -43,10 +43,11 @@ INSTALLED_APPS = [
     'django.contrib.sites',
     'django.contrib.flatpages',
     'sorl.thumbnail',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
+    'foodgram.refdata.RefDataMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,20 +55,27 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+if DEBUG:
+    INSTALLED_APPS += ['debug_toolbar']
+    MIDDLEWARE += ['debug_toolbar.middleware.DebugToolbarMiddleware']
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# Токен для доступа к /metrics без входа администратором:
+# Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES_DIRS = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'foodgram.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIRS],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -100,6 +108,51 @@ DATABASES = {
     }
 }
 
+# Необязательная реплика только для чтения с теми же параметрами, кроме
+# адреса (или файла для SQLite). В тестах она указывает на основную базу.
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME',
+                               DATABASES['default']['NAME']),
+        'HOST': os.environ.get('DB_REPLICA_HOST',
+                               DATABASES['default']['HOST']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+
+# Сколько секунд после изменения данных пользователь читает из основной базы
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+if REPLICA_DATABASES:
+    DATABASE_ROUTERS = ['foodgram.routers.ReplicaRouter']
+    MIDDLEWARE.insert(1, 'foodgram.routers.ReplicaPinMiddleware')
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# LocMemCache по умолчанию у каждого процесса свой: сброс кэша страниц в
+# одном воркере не виден остальным. При нескольких воркерах gunicorn
+# задайте общий кэш через CACHE_BACKEND и CACHE_LOCATION
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Страницы для анонимных пользователей сбрасываются по версии, а таймаут
+# лишь вычищает старые версии
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# Фрагменты карточек рецептов: ключ меняется вместе с рецептом, а таймаут
+# ограничивает только устаревание имени автора
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Справочники (теги, продукты, flatpages) тоже сбрасываются по версии
+REFDATA_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -148,6 +201,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Миниатюры создаются в фоновых процессах; при 0 - прямо в запросе,
+# как в sorl-thumbnail по умолчанию
+THUMBNAIL_BACKEND = 'recipes.thumbnails.PregeneratingThumbnailBackend'
+THUMBNAIL_KVSTORE = 'recipes.thumbnails.ThumbnailKVStore'
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
 
 # Login/out
 LOGIN_URL = '/auth/login'
@@ -17,24 +17,31 @@ from django.conf import settings
 from django.conf.urls import handler404
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.contrib.flatpages import views
 from django.urls import include, path
 
+from recipes.flatpages import flatpage
+
+from .metrics import metrics_view
+
 
 handler404 = 'recipes.views.page_not_found'  # noqa
 
 urlpatterns = [
     path('', include('recipes.urls')),
+    path('about/<path:url>', flatpage),
+    # Не обрабатывает запросы (их раньше перехватывает flatpage выше), но
+    # нужен FlatPage.get_absolute_url для ссылок из админки
     path('about/', include("django.contrib.flatpages.urls")),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 urlpatterns += [
-    path("about/about-author/", views.flatpage,
+    path("about/about-author/", flatpage,
          {"url": "/about-author/"}, name="about-author"),
-    path("about/about-spec/", views.flatpage,
+    path("about/about-spec/", flatpage,
          {"url": "/about-spec/"}, name="about-spec"),
 ]
 
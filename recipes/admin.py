@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Recipe, Product, Tag, Favorite, Purchase, Ingredient
+from .models import (AuthorStats, Recipe, Product, Tag, Favorite, Purchase,
+                     Ingredient)
 
 
 class IngredientInline(admin.TabularInline):
@@ -9,15 +10,11 @@ class IngredientInline(admin.TabularInline):
 
 class RecipeAdmin(admin.ModelAdmin):
     model = Recipe
-    list_display = ('pk', 'author', 'name', 'in_favorite_count',)
+    list_display = ('pk', 'author', 'name', 'favorites_count',
+                    'purchases_count',)
     list_filter = ('name', 'author', 'tags')
     inlines = (IngredientInline,)
 
-    def in_favorite_count(self, obj):
-        return obj.favorite_set.count()
-
-    in_favorite_count.short_description = 'В избранном'
-
 
 class ProductAdmin(admin.ModelAdmin):
     model = Product
@@ -25,25 +22,38 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('title',)
 
 
-class FavoriteAdmin(admin.ModelAdmin):
-    model = Favorite
-    list_display = ('pk', 'user', 'show_recipes',)
+class UserRecipeAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'recipe', 'created_at',)
+    list_select_related = ('user', 'recipe')
+    raw_id_fields = ('user', 'recipe')
 
-    def show_recipes(self, obj):
-        recipes = obj.recipes.all()
-        return '\n'.join([recipe.name for recipe in recipes])
+    def get_readonly_fields(self, request, obj=None):
+        # Счетчики и список покупок обновляются при создании и удалении
+        # строки, поэтому существующую строку нельзя перенести
+        if obj is not None:
+            return ('user', 'recipe')
+        return ()
 
 
-class PurchaseAdmin(admin.ModelAdmin):
+class FavoriteAdmin(UserRecipeAdmin):
     model = Favorite
-    list_display = ('pk', 'user', 'show_recipes',)
 
-    def show_recipes(self, obj):
-        recipes = obj.recipes.all()
-        return '\n'.join([recipe.name for recipe in recipes])
+
+class PurchaseAdmin(UserRecipeAdmin):
+    model = Purchase
+
+
+class AuthorStatsAdmin(admin.ModelAdmin):
+    model = AuthorStats
+    list_display = ('user', 'recipes_count', 'followers_count',
+                    'following_count', 'purchases_count',)
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'recipes_count', 'followers_count',
+                       'following_count', 'purchases_count',)
 
 
 admin.site.register(Recipe, RecipeAdmin)
+admin.site.register(AuthorStats, AuthorStatsAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Tag)
 admin.site.register(Favorite, FavoriteAdmin)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from foodgram import checks  # noqa
+        from . import signals  # noqa
@@ -0,0 +1,68 @@
+from bisect import bisect_left
+from heapq import nsmallest
+
+from foodgram.refdata import RefData
+
+from .models import Product
+
+
+AUTOCOMPLETE_LIMIT = 10
+
+
+def normalize(text):
+    # Регистр и "ё" не должны влиять на поиск: "Ёжевика" == "ежевика"
+    return text.strip().casefold().replace('ё', 'е')
+
+
+def _load_products():
+    return list(Product.objects.values_list('pk', 'title', 'unit'))
+
+
+class ProductIndex:
+    """
+    Префиксный индекс по каталогу продуктов в памяти процесса.
+
+    Хранит отсортированный по нормализованному названию список продуктов и
+    ищет по нему бинарным поиском, не обращаясь к базе. Каталог берется из
+    справочника, поэтому изменение продуктов в любом процессе сбрасывает
+    индекс во всех процессах.
+    """
+
+    def __init__(self):
+        self._catalog = RefData('products', _load_products, self._build)
+
+    def invalidate(self):
+        self._catalog.invalidate()
+
+    def _build(self, products):
+        rows = sorted(
+            (normalize(title), title, unit) for _, title, unit in products)
+        keys = [row[0] for row in rows]
+        items = [{'title': title, 'unit': unit} for _, title, unit in rows]
+        ids = {}
+        for pk, title, _ in products:
+            ids.setdefault(normalize(title), []).append(pk)
+        return keys, items, ids
+
+    def ids(self, titles):
+        """id продуктов с названиями titles (с любыми единицами)."""
+        _, _, ids = self._catalog.get()
+        return [pk for title in titles for pk in ids.get(normalize(title), ())]
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        keys, items, _ = self._catalog.get()
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        # Сначала точное совпадение, затем более короткие названия
+        ranked = nsmallest(
+            limit, range(start, end),
+            key=lambda i: (keys[i] != prefix, len(keys[i]), keys[i], i))
+        return [items[i] for i in ranked]
+
+
+product_index = ProductIndex()
@@ -0,0 +1,100 @@
+import statistics
+import time
+from collections import namedtuple
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from foodgram.metrics import RequestMetrics
+
+from .models import Favorite, Recipe, User
+from .seed import seed_username
+
+
+# Бюджет - максимальное число SQL-запросов на запрос к представлению при
+# холодном кэше, включая сессию, пользователя и счетчик покупок в шапке
+ViewBenchmark = namedtuple('ViewBenchmark', 'name url budget')
+BenchmarkResult = namedtuple(
+    'BenchmarkResult', 'name queries budget sql_ms wall_ms status')
+
+VIEW_BENCHMARKS = (
+    ViewBenchmark('index', lambda ctx: reverse('index'), 9),
+    ViewBenchmark(
+        'index (tag)', lambda ctx: reverse('index') + '?tag=breakfast', 10),
+    ViewBenchmark(
+        'profile',
+        lambda ctx: reverse('profile', args=[ctx['author'].pk]), 11),
+    ViewBenchmark(
+        'recipe_detail',
+        lambda ctx: reverse('recipe', args=[ctx['recipe'].pk]), 9),
+    ViewBenchmark('FavoriteView', lambda ctx: reverse('favorite'), 9),
+    ViewBenchmark(
+        'get_subscriptions', lambda ctx: reverse('my_subscriptions'), 6),
+    ViewBenchmark('PurchaseView', lambda ctx: reverse('purchases'), 4),
+    ViewBenchmark('send_shop_list', lambda ctx: reverse('shop-list'), 3),
+    ViewBenchmark('search', lambda ctx: reverse('search') + '?q=сахар', 10),
+    ViewBenchmark(
+        'get_ingredients',
+        lambda ctx: reverse('ingredients') + '?query=мук', 3),
+    ViewBenchmark(
+        'cookable',
+        lambda ctx: reverse('cookable') + '?' + urlencode({
+            'product': ctx['recipe'].ingredients.values_list(
+                'title', flat=True)[:3]}, doseq=True), 10),
+)
+
+
+def benchmark_context(username=None):
+    """Пользователь, от имени которого идут запросы, его автор и рецепт."""
+    user = User.objects.get(username=username or seed_username(0))
+    author = User.objects.filter(
+        following__user=user).order_by('pk').first() or user
+    recipe = Favorite.favorite.get_favorites(user)[:1]
+    recipe = recipe[0] if recipe else Recipe.recipes.order_by('pk').first()
+    return {'user': user, 'author': author, 'recipe': recipe}
+
+
+def _fetch(client, url):
+    response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def run_benchmarks(context, repeat=5, benchmarks=VIEW_BENCHMARKS):
+    """
+    Запрашивает представления тестовым клиентом и измеряет каждое.
+
+    Перед каждым запросом кэш очищается, поэтому число запросов к базе
+    соответствует худшему случаю. Время - медиана по repeat повторам;
+    время SQL измеряется так же, как в MetricsMiddleware: Django округляет
+    время запросов в connection.queries до миллисекунды.
+    """
+    client = Client()
+    client.force_login(context['user'])
+    results = []
+    for benchmark in benchmarks:
+        url = benchmark.url(context)
+        queries, sql_times, wall_times = 0, [], []
+        for _ in range(repeat):
+            cache.clear()
+            measured = RequestMetrics()
+            with connection.execute_wrapper(measured):
+                start = time.perf_counter()
+                response = _fetch(client, url)
+                wall_times.append(time.perf_counter() - start)
+            queries = max(queries, measured.queries)
+            sql_times.append(measured.db_time)
+        results.append(BenchmarkResult(
+            benchmark.name, queries, benchmark.budget,
+            statistics.median(sql_times) * 1000,
+            statistics.median(wall_times) * 1000,
+            response.status_code))
+    return results
+
+
+def over_budget(results):
+    return [result for result in results if result.queries > result.budget]
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .page_cache import track_uncacheable
+from .thumbnails import resolve_thumbnails
+
+
+CARD_KEY = 'recipes:card:{}:{}'
+
+
+def _card_key(card):
+    # modified меняется при изменении рецепта, его тегов и ингредиентов.
+    # Фрагмент строится из той же строки, что дала ключ, поэтому и при
+    # чтении из отставшей реплики старый HTML ляжет под старым ключом
+    return CARD_KEY.format(card.pk, card.modified.timestamp())
+
+
+def attach_fragments(cards):
+    """
+    Добавляет карточкам рецептов готовый HTML общей для всех части.
+
+    Картинка, название, теги и автор не зависят от пользователя, поэтому
+    фрагменты всей страницы читаются из кэша одним get_many, а
+    отрисовываются только отсутствующие (их миниатюры тоже ищутся разом).
+    Кнопки пользователя шаблон карточки выводит вокруг фрагмента. Карточки
+    с результатом подбора по продуктам (card.total) зависят от запроса, а
+    карточки, миниатюры которых еще создаются, показывают исходное
+    изображение; такие фрагменты не кэшируются.
+    """
+    cards = list(cards)
+    keys = [None if getattr(card, 'total', None) else _card_key(card)
+            for card in cards]
+    cached = cache.get_many([key for key in keys if key])
+    resolve_thumbnails([
+        card.image for card, key in zip(cards, keys) if key not in cached
+    ], '364x240')
+    rendered = {}
+    for card, key in zip(cards, keys):
+        if key is None:
+            continue
+        html = cached.get(key) or rendered.get(key)
+        if html is None:
+            with track_uncacheable() as uncacheable:
+                html = render_to_string(
+                    'recipe_card_body.html', {'card': card})
+            if not uncacheable:
+                rendered[key] = html
+        card.fragment = mark_safe(html)
+    if rendered:
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+    return cards
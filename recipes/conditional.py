@@ -0,0 +1,119 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from foodgram.routers import primary, used_replica
+
+from .models import AuthorStats, Recipe
+from .page_cache import get_pages_version
+
+
+VIEWER_KEY = 'recipes:viewer:{}'
+
+
+def get_viewer_version(user_id):
+    key = VIEWER_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000))
+        version = cache.get(key)
+    return version
+
+
+def bump_viewer_versions(user_ids):
+    """Сбрасывает ETag страниц, которые видят эти пользователи."""
+    for user_id in set(user_ids):
+        try:
+            cache.incr(VIEWER_KEY.format(user_id))
+        except ValueError:
+            get_viewer_version(user_id)
+
+
+def _viewer(request):
+    # Избранное, покупки и подписки пользователя, а также сессия: при входе
+    # меняется CSRF-токен, который выводится в формах страницы
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    return (user.pk, get_viewer_version(user.pk),
+            request.session.session_key)
+
+
+def _etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def listing_etag(request, *args, **kwargs):
+    # Версия страниц увеличивается при любом изменении рецептов и тегов
+    params = sorted({
+        (key, value)
+        for key, values in request.GET.lists() for value in values})
+    return _etag(request.path, params, get_pages_version(), _viewer(request))
+
+
+def profile_etag(request, user_id):
+    # Счетчики в шапке профиля меняются и без изменения рецептов, например
+    # при подписке на автора
+    with primary():
+        stats = AuthorStats.objects.filter(pk=user_id).values_list(
+            'recipes_count', 'followers_count', 'following_count').first()
+    return _etag(listing_etag(request), stats)
+
+
+def recipe_last_modified(request, recipe_id):
+    if not hasattr(request, '_recipe_modified'):
+        # Валидатор читается из основной базы, а страница, построенная по
+        # реплике, отдается без него
+        with primary():
+            request._recipe_modified = Recipe.recipes.filter(
+                pk=recipe_id).values_list('modified', flat=True).first()
+    return request._recipe_modified
+
+
+def recipe_etag(request, recipe_id):
+    modified = recipe_last_modified(request, recipe_id)
+    if modified is None:
+        return None
+    return _etag(request.path, modified.isoformat(), _viewer(request))
+
+
+def conditional_page(etag_func, last_modified_func=None):
+    """
+    Отвечает 304 Not Modified, если страница у клиента не устарела.
+
+    Last-Modified отдается только неавторизованным пользователям: время
+    изменения рецепта не учитывает состояние кнопок пользователя. Браузер
+    проверяет страницу при каждом открытии (Cache-Control: no-cache).
+    Страница, прочитанная из реплики, отдается без ETag и Last-Modified:
+    реплика могла отстать от версии, которую они называют.
+    """
+
+    def last_modified(request, *args, **kwargs):
+        if last_modified_func is None or request.user.is_authenticated:
+            return None
+        return last_modified_func(request, *args, **kwargs)
+
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=etag_func, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code == 200 and used_replica():
+                del response['ETag']
+                del response['Last-Modified']
+            if response.status_code in (200, 304):
+                if request.user.is_authenticated:
+                    patch_cache_control(response, no_cache=True, private=True)
+                else:
+                    patch_cache_control(response, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
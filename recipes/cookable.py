@@ -0,0 +1,186 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nlargest
+from itertools import chain
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .autocomplete import product_index
+from .models import Ingredient, Recipe
+
+
+VERSION_KEY = 'recipes:cookable:version'
+CHANGES_KEY = 'recipes:cookable:changes:{}'
+CHANGES_TIMEOUT = 60 * 60
+# Если процесс отстал сильнее, дешевле перестроить индекс целиком
+MAX_CHANGES_BEHIND = 500
+COOKABLE_LIMIT = 12
+MAX_PRODUCTS = 50
+
+
+class CookableIndex:
+    """
+    Обратный индекс продукт -> рецепты в памяти процесса.
+
+    Для каждого продукта хранит отсортированный массив id рецептов, для
+    каждого рецепта - его продукты. Изменения рецептов публикуются в кэше
+    как журнал с номером версии: остальные процессы перечитывают только
+    измененные рецепты, а при пропуске в журнале строят индекс заново.
+    """
+
+    def __init__(self):
+        self._postings = None
+        self._recipes = None
+        self._version = None
+        self._dirty = set()
+        self._lock = Lock()
+
+    def invalidate(self):
+        # Версия без журнала заставит все процессы построить индекс заново
+        with self._lock:
+            self._postings = None
+        self._publish(None)
+
+    def changed(self, recipe_ids):
+        recipe_ids = set(recipe_ids)
+        if not recipe_ids:
+            return
+        with self._lock:
+            self._dirty |= recipe_ids
+        self._publish(recipe_ids)
+
+    def _publish(self, recipe_ids):
+        # Другие процессы должны увидеть изменения только после коммита
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self._write_log(recipe_ids))
+        else:
+            self._write_log(recipe_ids)
+
+    def _write_log(self, recipe_ids):
+        cache.add(VERSION_KEY, 0, None)
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            return
+        if recipe_ids is not None:
+            cache.set(
+                CHANGES_KEY.format(version), recipe_ids, CHANGES_TIMEOUT)
+
+    def _build(self):
+        postings, recipes = {}, {}
+        rows = Ingredient.objects.order_by(
+            'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id').distinct()
+        for product_id, recipe_id in rows.iterator():
+            postings.setdefault(product_id, array('q')).append(recipe_id)
+            recipes.setdefault(recipe_id, set()).add(product_id)
+        return postings, recipes
+
+    def _reload(self, recipe_ids):
+        for recipe_id in recipe_ids:
+            for product_id in self._recipes.pop(recipe_id, ()):
+                posting = self._postings[product_id]
+                position = bisect_left(posting, recipe_id)
+                if position < len(posting) and posting[position] == recipe_id:
+                    del posting[position]
+        rows = Ingredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'recipe_id').distinct()
+        for product_id, recipe_id in rows:
+            products = self._recipes.setdefault(recipe_id, set())
+            if product_id not in products:
+                products.add(product_id)
+                insort(self._postings.setdefault(product_id, array('q')),
+                       recipe_id)
+
+    def _sync(self):
+        version = cache.get(VERSION_KEY, 0)
+        with self._lock:
+            # Версия меньше известной, если кэш был очищен
+            if self._postings is None or not (
+                    0 <= version - self._version <= MAX_CHANGES_BEHIND):
+                self._postings, self._recipes = self._build()
+                self._version = version
+                self._dirty = set()
+                return
+            changed = set(self._dirty)
+            if version > self._version:
+                keys = [CHANGES_KEY.format(number) for number in range(
+                    self._version + 1, version + 1)]
+                found = cache.get_many(keys)
+                if len(found) < len(keys):
+                    self._postings, self._recipes = self._build()
+                    self._version = version
+                    self._dirty = set()
+                    return
+                changed.update(*found.values())
+                self._version = version
+            if changed:
+                self._reload(changed)
+                self._dirty -= changed
+
+    def rank(self, product_ids, limit=COOKABLE_LIMIT):
+        """
+        Возвращает [(id рецепта, есть продуктов, всего продуктов)].
+
+        Рецепты упорядочены по доле имеющихся продуктов, затем по их
+        числу; в выдачу попадают рецепты хотя бы с одним продуктом.
+        """
+        self._sync()
+        product_ids = set(product_ids)
+        with self._lock:
+            postings = [self._postings.get(pk, ()) for pk in product_ids]
+            covered = Counter(chain.from_iterable(postings))
+            sizes = {
+                recipe_id: len(self._recipes[recipe_id])
+                for recipe_id in covered}
+        best = nlargest(
+            limit, covered.items(),
+            key=lambda item: (
+                item[1] / sizes[item[0]], item[1], item[0]))
+        return [(recipe_id, count, sizes[recipe_id])
+                for recipe_id, count in best]
+
+
+cookable_index = CookableIndex()
+
+
+def cookable_recipes(titles, limit=COOKABLE_LIMIT):
+    """
+    Рецепты, которые можно приготовить из продуктов с названиями titles.
+
+    У каждого рецепта заполнены covered и total - сколько его продуктов
+    есть и сколько всего, а missing - названия недостающих продуктов.
+    """
+    titles = list(dict.fromkeys(titles))[:MAX_PRODUCTS]
+    if not titles:
+        return []
+    # Одно название может быть в каталоге с разными единицами измерения
+    product_ids = product_index.ids(titles)
+    ranked = cookable_index.rank(product_ids, limit)
+    ids = [recipe_id for recipe_id, _, _ in ranked]
+    recipes = Recipe.recipes.filter(pk__in=ids).select_related(
+        'author').prefetch_related('tags').in_bulk()
+    rows = Ingredient.objects.filter(
+        recipe_id__in=ids
+    ).exclude(
+        ingredient_id__in=product_ids
+    ).order_by(
+        'ingredient__title'
+    ).values_list('recipe_id', 'ingredient__title').distinct()
+    missing = {}
+    for recipe_id, title in rows:
+        missing.setdefault(recipe_id, []).append(title)
+    result = []
+    for recipe_id, covered, total in ranked:
+        recipe = recipes.get(recipe_id)
+        if recipe is None:
+            continue
+        recipe.covered = covered
+        recipe.total = total
+        recipe.missing = missing.get(recipe_id, [])
+        result.append(recipe)
+    return result
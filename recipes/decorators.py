@@ -0,0 +1,76 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed
+from django.utils.log import log_response
+
+
+# Декораторы Django 3.1 для представлений синхронные: обернутая ими
+# корутина выполнялась бы как синхронное представление в отдельном потоке.
+# Здесь те же проверки для async def представлений.
+
+
+def _is_authenticated(request):
+    # request.user - ленивый объект, который читает сессию из базы
+    return request.user.is_authenticated
+
+
+def async_login_required(login_url=settings.LOGIN_URL):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if await sync_to_async(_is_authenticated)(request):
+                return await view(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), login_url)
+
+        return wrapper
+
+    return decorator
+
+
+def _not_allowed(request, methods):
+    response = HttpResponseNotAllowed(methods)
+    log_response(
+        'Method Not Allowed (%s): %s', request.method, request.path,
+        response=response, request=request)
+    return response
+
+
+def async_require_http_methods(methods):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return _not_allowed(request, methods)
+            return await view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def method_dispatch(**handlers):
+    """
+    Одно представление для URL с синхронными и асинхронными методами.
+
+    Например, страница избранного (GET) остается синхронной, а добавление
+    в избранное (POST) - асинхронное. Синхронные обработчики выполняются
+    в потоке для работы с базой, как это делает сам Django.
+    """
+    methods = [method.upper() for method in handlers]
+    views = {}
+    for method, view in handlers.items():
+        if not asyncio.iscoroutinefunction(view):
+            view = sync_to_async(view)
+        views[method.upper()] = view
+
+    async def dispatcher(request, *args, **kwargs):
+        view = views.get(request.method)
+        if view is None:
+            return _not_allowed(request, methods)
+        return await view(request, *args, **kwargs)
+
+    return dispatcher
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.flatpages.views import render_flatpage
+from django.contrib.sites.shortcuts import get_current_site
+from django.http import Http404, HttpResponsePermanentRedirect
+
+from foodgram.refdata import RefData
+
+
+def _load_flatpages():
+    links = FlatPage.sites.through.objects.select_related('flatpage')
+    return {(link.site_id, link.flatpage.url): link.flatpage
+            for link in links}
+
+
+cached_flatpages = RefData('flatpages', _load_flatpages)
+
+
+def flatpage(request, url):
+    """
+    То же, что django.contrib.flatpages.views.flatpage, но страница
+    берется из справочника в памяти процесса, а не из базы.
+    """
+    if not url.startswith('/'):
+        url = '/' + url
+    site_id = get_current_site(request).id
+    pages = cached_flatpages.get()
+    page = pages.get((site_id, url))
+    if page is None:
+        if (not url.endswith('/') and settings.APPEND_SLASH
+                and (site_id, url + '/') in pages):
+            return HttpResponsePermanentRedirect(f'{request.path}/')
+        raise Http404
+    return render_flatpage(request, page)
@@ -1,6 +1,7 @@
 from django import forms
+from django.core.exceptions import ValidationError
 
-from .models import Recipe, Tag
+from .models import Product, Recipe, Tag
 
 
 class RecipeForm(forms.ModelForm):
@@ -27,3 +28,37 @@ class RecipeForm(forms.ModelForm):
         labels = {
             'image': 'Загрузить фото'
         }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Флажки рисуются по справочнику; проверка выбора идет по базе
+        self.fields['tags'].choices = [
+            (tag.slug, tag.name) for tag in Tag.objects.cached()]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        titles = self.data.getlist('nameIngredient')
+        units = self.data.getlist('unitsIngredient')
+        values = self.data.getlist('valueIngredient')
+        if not len(titles) == len(units) == len(values):
+            raise ValidationError('Некорректный список ингредиентов')
+        try:
+            values = [float(value) for value in values]
+        except ValueError:
+            raise ValidationError('Количество ингредиента должно быть числом')
+        if any(value < 0 for value in values):
+            raise ValidationError(
+                'Количество ингредиента не может быть отрицательным')
+        pairs = list(zip(titles, units))
+        products, missing = Product.objects.resolve(pairs)
+        if missing:
+            raise ValidationError([
+                f'Неизвестный продукт: {title} ({unit})'
+                for title, unit in sorted(missing)])
+        # Повторяющиеся продукты складываются в одну строку
+        amounts = {}
+        for pair, value in zip(pairs, values):
+            product = products[pair]
+            amounts[product] = amounts.get(product, 0) + value
+        cleaned_data['ingredients'] = amounts
+        return cleaned_data
@@ -0,0 +1,110 @@
+import json
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client
+
+from recipes.models import Recipe, User
+from recipes.seed import seed_username
+
+
+ENDPOINTS = ('favorites', 'purchases', 'ingredients')
+QUERIES = ('мук', 'сах', 'мол', 'яй', 'соль', 'кар')
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенный сервер параллельными нажатиями кнопок '
+            '"в избранное" и "в покупки" или запросами автодополнения и '
+            'выводит пропускную способность и задержки. Позволяет сравнить '
+            'запуск через WSGI (gunicorn) и ASGI (uvicorn).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--username', help='По умолчанию seed-user-0')
+        parser.add_argument(
+            '--endpoint', choices=ENDPOINTS, default='favorites')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(
+                username=options['username'] or seed_username(0))
+        except User.DoesNotExist:
+            raise CommandError('Пользователь не найден, запустите seed_data')
+        client = Client()
+        client.force_login(user)
+        request = HttpRequest()
+        token = get_token(request)
+        headers = {
+            'Cookie': (
+                f'{settings.SESSION_COOKIE_NAME}='
+                f'{client.cookies[settings.SESSION_COOKIE_NAME].value}; '
+                f'{settings.CSRF_COOKIE_NAME}={request.META["CSRF_COOKIE"]}'),
+            'X-CSRFToken': token,
+            'Content-Type': 'application/json',
+        }
+        requests = list(islice(
+            self._requests(options['url'], options['endpoint'], headers),
+            options['requests']))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(_send, requests))
+        wall = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, status in results)
+        errors = Counter(
+            status for latency, status in results if status != 200)
+        self.stdout.write(
+            f'{options["endpoint"]}: {len(results)} запросов, '
+            f'{options["concurrency"]} параллельно')
+        self.stdout.write(f'запросов в секунду: {len(results) / wall:.1f}')
+        self.stdout.write(
+            f'задержка, мс: медиана '
+            f'{statistics.median(latencies) * 1000:.1f}, '
+            f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}')
+        # Код 0 - сервер не ответил
+        self.stdout.write(f'ошибок: {sum(errors.values())} ' + ', '.join(
+            f'{status}: {count}' for status, count in sorted(errors.items())))
+
+    def _requests(self, url, endpoint, headers):
+        if endpoint == 'ingredients':
+            for query in cycle(QUERIES):
+                yield Request(
+                    f'{url}/ingredients?query={quote(query)}', headers=headers)
+        # Нажатие "добавить" и повторное нажатие "убрать" для каждого рецепта
+        ids = list(Recipe.recipes.order_by(
+            'pk').values_list('pk', flat=True)[:200])
+        if not ids:
+            raise CommandError('Нет рецептов, запустите seed_data')
+        for recipe_id in cycle(ids):
+            yield Request(
+                f'{url}/{endpoint}', method='POST', headers=headers,
+                data=json.dumps({'id': recipe_id}).encode())
+            yield Request(
+                f'{url}/{endpoint}/{recipe_id}', method='DELETE',
+                headers=headers)
+
+
+def _send(request):
+    start = time.perf_counter()
+    try:
+        with urlopen(request, timeout=30) as response:
+            response.read()
+            status = response.status
+    except HTTPError as error:
+        status = error.code
+    except (URLError, OSError):
+        status = 0
+    return time.perf_counter() - start, status
@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+from itertools import combinations
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe, Tag, User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает фильтр по тегам через JOIN + DISTINCT и по маске '
+            'тегов на сгенерированных рецептах. Данные удаляются после '
+            'замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            tags = self._seed(options['recipes'], options['seed'])
+            self._measure(tags, options['repeat'])
+            transaction.set_rollback(True)
+
+    def _seed(self, count, seed):
+        rnd = random.Random(seed)
+        tags = list(Tag.objects.all())
+        for slug in ('breakfast', 'lunch', 'dinner')[len(tags):]:
+            tags.append(Tag.objects.create(name=slug, slug=slug))
+        author = User.objects.create(username=f'bench-{seed}')
+        recipes = []
+        recipe_tags = []
+        for i in range(count):
+            chosen = rnd.sample(tags, rnd.randint(1, len(tags)))
+            recipe_tags.append(chosen)
+            recipes.append(Recipe(
+                author=author, name=f'recipe {i}', description='',
+                cook_time=rnd.randint(5, 120),
+                tag_mask=sum(tag.mask for tag in chosen)))
+        Recipe.recipes.bulk_create(recipes, batch_size=5000)
+        through = Recipe.tags.through
+        ids = Recipe.recipes.filter(
+            author=author
+        ).order_by('pk').values_list('pk', flat=True)
+        through.objects.bulk_create(
+            (through(recipe_id=pk, tag_id=tag.pk)
+             for pk, chosen in zip(ids, recipe_tags) for tag in chosen),
+            batch_size=5000)
+        self.stdout.write(f'Создано рецептов: {count}')
+        return tags
+
+    def _measure(self, tags, repeat):
+        slugs = [tag.slug for tag in tags]
+        variants = {
+            'join': lambda s: Recipe.recipes.filter(
+                tags__slug__in=s).distinct(),
+            'mask': lambda s: Recipe.recipes.tag_filter(s),
+        }
+        for size in range(1, len(slugs)):
+            for chosen in combinations(slugs, size):
+                line = [', '.join(chosen).ljust(24)]
+                for name, build in variants.items():
+                    timings = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        queryset = build(chosen)
+                        queryset.count()
+                        list(queryset.order_by('-pub_date', '-pk')[:6])
+                        timings.append(time.perf_counter() - start)
+                    median = statistics.median(timings) * 1000
+                    line.append(f'{name}: {median:8.2f} мс')
+                self.stdout.write('  '.join(line))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.benchmarks import benchmark_context, over_budget, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Замеряет число SQL-запросов, время SQL и общее время основных '
+            'страниц на данных из seed_data. Завершается с ошибкой, если '
+            'страница превысила бюджет запросов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='По умолчанию seed-user-0')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        context = benchmark_context(options['username'])
+        results = run_benchmarks(context, repeat=options['repeat'])
+        self.stdout.write(
+            f'{"страница":<20}{"запросы":>12}{"SQL, мс":>10}'
+            f'{"всего, мс":>11}{"код":>6}')
+        for result in results:
+            self.stdout.write(
+                f'{result.name:<20}'
+                f'{result.queries:>7} / {result.budget:<2}'
+                f'{result.sql_ms:>10.1f}{result.wall_ms:>11.1f}'
+                f'{result.status:>6}')
+        failed = over_budget(results)
+        if failed:
+            raise CommandError('Превышен бюджет запросов: ' + ', '.join(
+                result.name for result in failed))
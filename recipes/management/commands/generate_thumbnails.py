@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+from recipes.page_cache import bump_pages_version
+from recipes.thumbnails import pregenerate, pregenerate_placeholder
+
+
+class Command(BaseCommand):
+    help = ('Создает миниатюры всех размеров и форматов и заглушки для уже '
+            'загруженных изображений')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        names = Recipe.recipes.exclude(
+            image=''
+        ).values_list('image', flat=True).distinct().iterator()
+        done = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for name in pool.map(pregenerate, names, chunksize=16):
+                done += 1
+                self.stdout.write(f'{done}: {name}')
+        self.stdout.write(f'Обработано изображений: {done}')
+        names = Recipe.recipes.exclude(image='').filter(
+            image_placeholder=''
+        ).values_list('image', flat=True).distinct().iterator()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for name, placeholder in pool.map(
+                    pregenerate_placeholder, names, chunksize=16):
+                Recipe.recipes.filter(image=name).update(
+                    image_placeholder=placeholder, modified=timezone.now())
+        # Страницы в кэше выводят изображения без заглушек
+        bump_pages_version()
+        self.stdout.write('Заглушки изображений созданы')
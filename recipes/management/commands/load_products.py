@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.autocomplete import product_index
+from recipes.models import Product
+
+
+MAX_LENGTH = Product._meta.get_field('title').max_length
+
+
+class Command(BaseCommand):
+    help = ('Добавляет в каталог недостающие продукты из CSV '
+            '(название,единицы) или NDJSON ({"title": ..., "unit": ...}). '
+            'Продукт определяется парой название-единицы, поэтому '
+            'существующие продукты не меняются, и команду можно запускать '
+            'повторно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или "-" для stdin')
+        parser.add_argument('--format', choices=('csv', 'ndjson'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or (
+            'ndjson' if options['path'].endswith(('.ndjson', '.jsonl'))
+            else 'csv')
+        self.skipped = 0
+        if options['path'] == '-':
+            stats = self._load(sys.stdin, fmt, options['batch_size'])
+        else:
+            try:
+                with open(options['path'], encoding='utf-8',
+                          newline='') as stream:
+                    stats = self._load(stream, fmt, options['batch_size'])
+            except OSError as error:
+                raise CommandError(error)
+        product_index.invalidate()
+        inserted, existing = stats
+        self.stdout.write(
+            f'Добавлено: {inserted}, уже есть: {existing}, '
+            f'пропущено: {self.skipped}')
+
+    def _load(self, stream, fmt, batch_size):
+        rows = self._read(stream, fmt)
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                return self._copy(rows, batch_size)
+            return self._insert_missing(rows, batch_size)
+
+    def _read(self, stream, fmt):
+        if fmt == 'csv':
+            records = (row[:2] for row in csv.reader(stream))
+        else:
+            records = self._read_ndjson(stream)
+        for line, record in enumerate(records, 1):
+            if len(record) < 2:
+                self._skip(line, record)
+                continue
+            title, unit = (value.strip() for value in record)
+            if not title or not unit or max(
+                    len(title), len(unit)) > MAX_LENGTH:
+                self._skip(line, record)
+                continue
+            yield title, unit
+
+    def _read_ndjson(self, stream):
+        for text in stream:
+            if not text.strip():
+                continue
+            try:
+                data = json.loads(text)
+                record = data['title'], data['unit']
+            except (ValueError, TypeError, KeyError):
+                record = ()
+            if not all(isinstance(value, str) for value in record):
+                record = ()
+            yield record
+
+    def _skip(self, line, record):
+        self.skipped += 1
+        self.stderr.write(f'Строка {line} пропущена: {record!r}')
+
+    def _insert_missing(self, rows, batch_size):
+        # Как и _copy, считает строки файла: добавленные продукты и
+        # остальные (продукт уже был в каталоге или повторился в файле)
+        inserted = existing = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return inserted, existing
+            found = set(Product.objects.filter(
+                title__in={title for title, _ in batch}
+            ).values_list('title', 'unit'))
+            new = set(batch) - found
+            Product.objects.bulk_create(
+                Product(title=title, unit=unit) for title, unit in new)
+            inserted += len(new)
+            existing += len(batch) - len(new)
+
+    def _copy(self, rows, batch_size):
+        # COPY во временную таблицу, затем одна вставка недостающих пар
+        table = Product._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE product_import '
+                '(title varchar(255), unit varchar(255))')
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY product_import (title, unit) FROM STDIN '
+                    'WITH (FORMAT csv)', buffer)
+            cursor.execute('SELECT COUNT(*) FROM product_import')
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f'INSERT INTO {table} (title, unit) '
+                f'SELECT DISTINCT i.title, i.unit FROM product_import i '
+                f'WHERE NOT EXISTS (SELECT 1 FROM {table} p '
+                f'WHERE p.title = i.title AND p.unit = i.unit)')
+            inserted = cursor.rowcount
+            # Таблица удаляется сразу: транзакция команды может быть
+            # вложенной (например, в тестах), и ON COMMIT не наступит
+            cursor.execute('DROP TABLE product_import')
+        return inserted, total - inserted
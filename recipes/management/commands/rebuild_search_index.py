@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс рецептов'
+
+    def handle(self, *args, **options):
+        search_index.rebuild()
+        self.stdout.write(
+            f'Индекс перестроен: {type(search_index.backend).__name__}')
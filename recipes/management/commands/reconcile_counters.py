@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import AuthorStats, Recipe, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные данные по исходным таблицам'
+
+    def handle(self, *args, **options):
+        updated = Recipe.recipes.recount()
+        self.stdout.write(f'Счетчиков рецептов пересчитано: {updated}')
+        updated = AuthorStats.objects.recount()
+        self.stdout.write(f'Счетчиков пользователей пересчитано: {updated}')
+        ShoppingListItem.objects.rebuild()
+        self.stdout.write('Сводные списки продуктов пересобраны')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import User
+from recipes.seed import SEED_PREFIX, seed
+
+
+class Command(BaseCommand):
+    help = ('Создает детерминированный набор пользователей, рецептов, '
+            'избранного, покупок и подписок для нагрузочных замеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Ингредиентов в рецепте')
+        parser.add_argument('--tags', type=int, default=3)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Рецептов в избранном у пользователя')
+        parser.add_argument('--purchases', type=int, default=10,
+                            help='Рецептов в покупках у пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок у пользователя')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--flush', action='store_true',
+                            help='Удалить ранее созданные данные')
+
+    def handle(self, *args, **options):
+        seeded = User.objects.filter(username__startswith=f'{SEED_PREFIX}-')
+        if options['flush']:
+            seeded.delete()
+        elif seeded.exists():
+            raise CommandError(
+                'Данные уже созданы, используйте --flush для пересоздания')
+        created = seed(
+            users=options['users'], recipes=options['recipes'],
+            ingredients=options['ingredients'], tags=options['tags'],
+            products=options['products'], favorites=options['favorites'],
+            purchases=options['purchases'],
+            subscriptions=options['subscriptions'],
+            random_seed=options['seed'])
+        self.stdout.write(', '.join(
+            f'{name}: {count}' for name, count in created.items()))
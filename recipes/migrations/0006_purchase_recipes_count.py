@@ -0,0 +1,31 @@
+# Generated by Django 3.1.9 on 2026-10-18 17:47
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_purchases(apps, schema_editor):
+    Purchase = apps.get_model('recipes.Purchase')
+    count = Purchase.recipes.through.objects.filter(
+        purchase_id=models.OuterRef('pk')
+    ).order_by().values('purchase_id').annotate(
+        total=models.Count('pk')
+    ).values('total')
+    Purchase._default_manager.update(recipes_count=Coalesce(
+        models.Subquery(count), models.Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_auto_20200914_0918'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Рецептов в списке покупок'),
+        ),
+        migrations.RunPython(count_purchases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+def fill_tag_masks(apps, schema_editor):
+    Tag = apps.get_model('recipes.Tag')
+    Recipe = apps.get_model('recipes.Recipe')
+    for bit, tag in enumerate(Tag._default_manager.order_by('pk')):
+        tag.bit = bit
+        tag.save(update_fields=['bit'])
+    masks = {}
+    rows = Recipe.tags.through.objects.values_list('recipe_id', 'tag__bit')
+    for recipe_id, bit in rows:
+        masks[recipe_id] = masks.get(recipe_id, 0) | (1 << bit)
+    recipes = {}
+    for recipe_id, mask in masks.items():
+        recipes.setdefault(mask, []).append(recipe_id)
+    for mask, ids in recipes.items():
+        Recipe._default_manager.filter(pk__in=ids).update(tag_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_purchase_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Бит в маске тегов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tag_masks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, unique=True, verbose_name='Бит в маске тегов'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.9 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['title', 'unit'], name='recipes_pro_title_1856b8_idx'),
+        ),
+    ]
@@ -0,0 +1,137 @@
+import re
+from collections import defaultdict
+
+from django.db import OperationalError, migrations
+
+
+SEARCH_TABLE = 'recipes_recipe_search'
+
+# Копия recipes.stemmer на момент миграции: миграция не должна зависеть
+# от кода приложения, который может измениться
+_VOWELS = 'аеиоуыэюя'
+_RV = re.compile(f'^(.*?[{_VOWELS}])(.*)$')
+_PERFECTIVE_GERUND = re.compile(
+    '((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile('(с[яь])$')
+_ADJECTIVE = re.compile(
+    '(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    'ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile('((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    '((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    '((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+_NOUN = re.compile(
+    '(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+_DERIVATIONAL = re.compile(f'.*[^{_VOWELS}]+[{_VOWELS}].*ость?$')
+_DER = re.compile('ость?$')
+_SUPERLATIVE = re.compile('(ейше|ейш)$')
+_I = re.compile('и$')
+
+
+def _strip(pattern, word):
+    return pattern.sub('', word, 1)
+
+
+def stem(word):
+    """Возвращает основу русского слова в нижнем регистре."""
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    stripped = _strip(_PERFECTIVE_GERUND, rv)
+    if stripped == rv:
+        rv = _strip(_REFLEXIVE, rv)
+        stripped = _strip(_ADJECTIVE, rv)
+        if stripped != rv:
+            rv = _strip(_PARTICIPLE, stripped)
+        else:
+            stripped = _strip(_VERB, rv)
+            rv = _strip(_NOUN, rv) if stripped == rv else stripped
+    else:
+        rv = stripped
+    rv = _strip(_I, rv)
+    if _DERIVATIONAL.match(rv):
+        rv = _strip(_DER, rv)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = _strip(_SUPERLATIVE, rv)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return start + rv
+
+
+def _stem_text(text):
+    text = text.casefold().replace('ё', 'е')
+    return ' '.join(stem(token) for token in re.findall(r'\w+', text))
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE {SEARCH_TABLE} ('
+            f'recipe_id integer PRIMARY KEY REFERENCES recipes_recipe (id) '
+            f'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            f'document tsvector NOT NULL)')
+        schema_editor.execute(
+            f'CREATE INDEX {SEARCH_TABLE}_document ON {SEARCH_TABLE} '
+            f'USING GIN (document)')
+        schema_editor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (recipe_id, document) '
+            f'SELECT r.id, '
+            f"setweight(to_tsvector('russian', r.name), 'A') || "
+            f"setweight(to_tsvector('russian', r.description), 'B') || "
+            f"setweight(to_tsvector('russian', "
+            f"coalesce(string_agg(p.title, ' '), '')), 'C') "
+            f'FROM recipes_recipe r '
+            f'LEFT JOIN recipes_ingredient i ON i.recipe_id = r.id '
+            f'LEFT JOIN recipes_product p ON p.id = i.ingredient_id '
+            f'GROUP BY r.id')
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+                f'name, description, ingredients, '
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        except OperationalError:
+            # SQLite собран без FTS5: поиск работает без индекса
+            return
+        schema_editor.execute(
+            f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) "
+            f"VALUES ('rank', 'bm25(10.0, 1.0, 4.0)')")
+        Recipe = apps.get_model('recipes', 'Recipe')
+        Ingredient = apps.get_model('recipes', 'Ingredient')
+        ingredients = defaultdict(list)
+        for recipe_id, title in Ingredient._default_manager.values_list(
+                'recipe_id', 'ingredient__title'):
+            ingredients[recipe_id].append(title)
+        rows = [
+            (pk, _stem_text(name), _stem_text(description),
+             _stem_text(' '.join(ingredients[pk])))
+            for pk, name, description in Recipe._default_manager.values_list(
+                'pk', 'name', 'description')]
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} '
+                f'(rowid, name, description, ingredients) '
+                f'VALUES (%s, %s, %s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_product_title_unit_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,132 @@
+# Generated by Django 3.1.9 on 2026-10-18 18:45
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+import django.db.models.deletion
+import django.db.models.manager
+
+
+BATCH_SIZE = 5000
+
+
+def _count(queryset, field):
+    return Coalesce(models.Subquery(
+        queryset.filter(
+            **{field: models.OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=models.Count('pk')
+        ).values('total')), models.Value(0))
+
+
+def _move(old_model, container, new_model):
+    # Строки связей переносятся пакетами в порядке добавления; дубликаты
+    # (второй контейнер того же пользователя) отбрасываются
+    through = old_model.recipes.through
+    now = timezone.now()
+    rows = through.objects.order_by('pk').values_list(
+        f'{container}__user_id', 'recipe_id').iterator()
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        new_model._default_manager.bulk_create(
+            [new_model(user_id=user, recipe_id=recipe, created_at=now)
+             for user, recipe in batch],
+            ignore_conflicts=True)
+
+
+def move_rows(apps, schema_editor):
+    Recipe = apps.get_model('recipes.Recipe')
+    AuthorStats = apps.get_model('recipes.AuthorStats')
+    FavoriteRow = apps.get_model('recipes.FavoriteRow')
+    PurchaseRow = apps.get_model('recipes.PurchaseRow')
+    _move(apps.get_model('recipes.Favorite'), 'favorite', FavoriteRow)
+    _move(apps.get_model('recipes.Purchase'), 'purchase', PurchaseRow)
+    favorites = FavoriteRow._default_manager.all()
+    purchases = PurchaseRow._default_manager.all()
+    Recipe._default_manager.update(
+        favorites_count=_count(favorites, 'recipe'),
+        purchases_count=_count(purchases, 'recipe'))
+    AuthorStats.objects.update(purchases_count=_count(purchases, 'user'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0012_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FavoriteRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время добавления')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+            managers=[
+                ('favorite', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PurchaseRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время добавления')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+            managers=[
+                ('purchase', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='favoriterow',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='favorite_user_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='purchaserow',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='purchase_user_recipe'),
+        ),
+        migrations.AddField(
+            model_name='authorstats',
+            name='purchases_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Рецептов в списке покупок'),
+        ),
+        migrations.RunPython(move_rows),
+        migrations.DeleteModel(
+            name='Favorite',
+        ),
+        migrations.DeleteModel(
+            name='Purchase',
+        ),
+        migrations.RenameModel(
+            old_name='FavoriteRow',
+            new_name='Favorite',
+        ),
+        migrations.RenameModel(
+            old_name='PurchaseRow',
+            new_name='Purchase',
+        ),
+        # Индексы строятся после переноса данных
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', 'created_at', 'recipe'], name='favorite_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['user', 'created_at', 'recipe'], name='purchase_user_created'),
+        ),
+    ]
@@ -1,40 +1,203 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import Signal
+from django.utils import timezone
+
+from foodgram.refdata import RefData
+from users.models import Subscription
 
 
 User = get_user_model()
 
 
+class ProductManager(models.Manager):
+    def resolve(self, pairs):
+        """
+        Находит продукты по парам (название, единицы) одним запросом.
+
+        Возвращает словарь найденных продуктов и множество ненайденных пар.
+        """
+        pairs = set(pairs)
+        products = {}
+        for product in super().get_queryset().filter(
+                title__in={title for title, _ in pairs}):
+            key = (product.title, product.unit)
+            if key in pairs:
+                products.setdefault(key, product)
+        return products, pairs - products.keys()
+
+
 class Product(models.Model):
     title = models.CharField(max_length=255, verbose_name='Название продукта')
     unit = models.CharField(max_length=255, verbose_name='Единицы измерения')
 
+    objects = ProductManager()
+
+    class Meta:
+        indexes = [models.Index(fields=('title', 'unit'))]
+
     def __str__(self):
         return f'{self.title}, {self.unit}'
 
 
+# Номер бита тега в Recipe.tag_mask; старший бит BigIntegerField не
+# используется, чтобы маска оставалась положительной
+MAX_TAG_BITS = 63
+
+
+class TagManager(models.Manager):
+    def cached(self):
+        """Все теги из справочника в памяти процесса, без запроса к базе."""
+        return cached_tags.get()
+
+    def get_mask(self, slugs):
+        slugs = set(slugs)
+        return sum(tag.mask for tag in self.cached() if tag.slug in slugs)
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название тега')
     slug = models.SlugField(verbose_name='Слаг тега')
+    bit = models.PositiveSmallIntegerField(
+        unique=True, editable=False, verbose_name='Бит в маске тегов')
+
+    objects = TagManager()
 
     def __str__(self):
         return f'{self.name}'
 
+    def _free_bit(self):
+        used = set(Tag.objects.values_list('bit', flat=True))
+        free = [bit for bit in range(MAX_TAG_BITS) if bit not in used]
+        if not free:
+            raise ValueError(f'Нельзя создать больше {MAX_TAG_BITS} тегов')
+        return free[0]
+
+    def save(self, *args, **kwargs):
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+        # Тот же свободный бит мог занять параллельно созданный тег: тогда
+        # вставка нарушает уникальность bit, и бит выбирается заново
+        for attempt in range(MAX_TAG_BITS):
+            self.bit = self._free_bit()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                self.bit = None
+                if attempt == MAX_TAG_BITS - 1:
+                    raise
+
+    @property
+    def mask(self):
+        return 1 << self.bit
+
+
+cached_tags = RefData('tags', lambda: list(Tag.objects.all()))
+
+
+def shift_counters(queryset, field, deltas):
+    """
+    Прибавляет к счетчику строк {pk: изменение} выражением F().
+
+    Одно UPDATE на каждое встречающееся изменение; счетчик не опускается
+    ниже нуля, даже если он разошелся с исходными таблицами.
+    """
+    groups = {}
+    for pk, delta in deltas.items():
+        if delta:
+            groups.setdefault(delta, []).append(pk)
+    for delta, ids in groups.items():
+        value = models.F(field) + delta
+        if delta < 0:
+            value = Greatest(value, models.Value(0))
+        queryset.filter(pk__in=ids).update(**{field: value})
+
+
+def count_rows(queryset, field):
+    # Подзапрос: число строк queryset со значением field, равным OuterRef
+    return Coalesce(models.Subquery(
+        queryset.filter(
+            **{field: models.OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=models.Count('pk')
+        ).values('total')), models.Value(0))
+
+
+def filter_by_tag_mask(queryset, tags):
+    mask = Tag.objects.get_mask(tags)
+    return queryset.annotate(
+        tag_match=models.F('tag_mask').bitand(mask)
+    ).filter(tag_match__gt=0)
+
 
 class RecipeManager(models.Manager):
+    def touch(self, recipes):
+        # Обновляет время изменения без сигналов post_save
+        super().get_queryset().filter(
+            pk__in=list(recipes)).update(modified=timezone.now())
+
+    def shift_counter(self, field, deltas):
+        shift_counters(super().get_queryset(), field, deltas)
+
+    def recount(self, recipes=None):
+        """Пересчитывает счетчики избранного и покупок по таблицам связей."""
+        queryset = super().get_queryset()
+        if recipes is not None:
+            queryset = queryset.filter(pk__in=list(recipes))
+        return queryset.update(
+            favorites_count=count_rows(Favorite.favorite.all(), 'recipe'),
+            purchases_count=count_rows(Purchase.purchase.all(), 'recipe'))
+
+    def update_tag_masks(self, recipes):
+        through = self.model.tags.through
+        masks = dict.fromkeys(recipes, 0)
+        rows = through.objects.filter(
+            recipe_id__in=masks
+        ).values_list('recipe_id', 'tag__bit')
+        for recipe_id, bit in rows:
+            masks[recipe_id] |= 1 << bit
+        # Одно обновление на каждое встречающееся значение маски
+        groups = {}
+        for recipe_id, mask in masks.items():
+            groups.setdefault(mask, []).append(recipe_id)
+        now = timezone.now()
+        for mask, ids in groups.items():
+            super().get_queryset().filter(pk__in=ids).update(
+                tag_mask=mask, modified=now)
+
     def tag_filter(self, tags):
         if tags:
-            return super().get_queryset().prefetch_related(
-                'author', 'tags'
-            ).filter(
-                tags__slug__in=tags
-            ).distinct()
+            return filter_by_tag_mask(
+                super().get_queryset().prefetch_related('author', 'tags'),
+                tags)
         else:
             return super().get_queryset().prefetch_related(
                 'author', 'tags'
             ).all()
 
+    def latest_by_authors(self, authors, limit):
+        """
+        Возвращает {id автора: последние limit рецептов} одним запросом.
+
+        Для каждого рецепта коррелированный подзапрос проверяет, что он
+        входит в limit последних рецептов своего автора.
+        """
+        latest = super().get_queryset().filter(
+            author=models.OuterRef('author')
+        ).order_by('-pub_date', '-pk').values('pk')[:limit]
+        recipes = super().get_queryset().filter(
+            author__in=authors, pk__in=models.Subquery(latest)
+        ).only(
+            'id', 'author_id', 'name', 'image', 'image_placeholder',
+            'cook_time', 'pub_date'
+        ).order_by('-pub_date', '-pk')
+        result = {author: [] for author in authors}
+        for recipe in recipes:
+            result[recipe.author_id].append(recipe)
+        return result
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE,
@@ -44,12 +207,28 @@ class Recipe(models.Model):
     description = models.TextField(verbose_name='Описание рецепта')
     image = models.ImageField(upload_to='recipes/',
                               verbose_name='Изображение блюда')
+    # Размытая копия 16px (data URI), создается сигналом при загрузке
+    image_placeholder = models.TextField(
+        blank=True, editable=False, verbose_name='Заглушка изображения')
     tags = models.ManyToManyField(Tag, verbose_name='Теги', blank=True)
     ingredients = models.ManyToManyField(
         Product, through='Ingredient', related_name='recipe_ingredients')
     cook_time = models.IntegerField(verbose_name='Время приготовления')
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name='Время публикации', db_index=True)
+    # Обновляется и при изменении тегов и ингредиентов рецепта
+    modified = models.DateTimeField(
+        auto_now=True, verbose_name='Время изменения')
+    # Побитовое ИЛИ Tag.mask всех тегов рецепта, поддерживается сигналами.
+    # Без индекса: B-tree не помогает условию (tag_mask & mask) > 0
+    tag_mask = models.BigIntegerField(
+        default=0, editable=False, verbose_name='Маска тегов')
+    # Поддерживаются сигналами, сверяются командой reconcile_counters
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, db_index=True,
+        verbose_name='В избранном')
+    purchases_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В списках покупок')
 
     recipes = RecipeManager()
 
@@ -60,11 +239,107 @@ class Recipe(models.Model):
         return f'{self.name}'
 
 
+class AuthorStatsManager(models.Manager):
+    def shift(self, field, deltas):
+        shift_counters(super().get_queryset(), field, deltas)
+
+    def recount(self, users=None):
+        """
+        Пересчитывает счетчики по рецептам, подпискам и покупкам.
+
+        Недостающие строки (например, у пользователей, созданных через
+        bulk_create) создаются перед пересчетом.
+        """
+        users_queryset = User.objects.all()
+        queryset = super().get_queryset()
+        if users is not None:
+            users = list(users)
+            users_queryset = users_queryset.filter(pk__in=users)
+            queryset = queryset.filter(pk__in=users)
+        self.bulk_create(
+            (self.model(user_id=pk) for pk in users_queryset.filter(
+                author_stats__isnull=True).values_list('pk', flat=True)),
+            ignore_conflicts=True)
+        return queryset.update(
+            recipes_count=count_rows(Recipe.recipes.all(), 'author'),
+            followers_count=count_rows(Subscription.objects.all(), 'author'),
+            following_count=count_rows(Subscription.objects.all(), 'user'),
+            purchases_count=count_rows(Purchase.purchase.all(), 'user'))
+
+
+class AuthorStats(models.Model):
+    """Счетчики пользователя, поддерживаются сигналами."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='author_stats')
+    recipes_count = models.PositiveIntegerField(
+        default=0, verbose_name='Рецептов')
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписок')
+    purchases_count = models.PositiveIntegerField(
+        default=0, verbose_name='Рецептов в списке покупок')
+
+    objects = AuthorStatsManager()
+
+    def __str__(self):
+        return f'{self.user}'
+
+
+# Отправляется после массового изменения состава рецепта
+ingredients_changed = Signal()
+
+
+class IngredientManager(models.Manager):
+    def sync(self, recipe, amounts):
+        """
+        Приводит ингредиенты рецепта к словарю {продукт: количество}.
+
+        Меняются только отличающиеся строки; неизмененные не трогаются.
+        """
+        existing = {}
+        duplicates = []
+        for ingredient in super().get_queryset().filter(recipe=recipe):
+            if ingredient.ingredient_id in existing:
+                duplicates.append(ingredient.pk)
+            else:
+                existing[ingredient.ingredient_id] = ingredient
+        to_create, to_update = [], []
+        for product, amount in amounts.items():
+            ingredient = existing.pop(product.pk, None)
+            if ingredient is None:
+                to_create.append(self.model(
+                    recipe=recipe, ingredient=product, amount=amount))
+            elif ingredient.amount != amount:
+                ingredient.amount = amount
+                to_update.append(ingredient)
+        to_delete = duplicates + [i.pk for i in existing.values()]
+        with transaction.atomic():
+            if to_delete:
+                super().get_queryset().filter(pk__in=to_delete).delete()
+            if to_update:
+                self.bulk_update(to_update, ['amount'])
+            if to_create:
+                self.bulk_create(to_create)
+        # Массовые операции не отправляют сигналы
+        if to_create or to_delete:
+            ingredients_changed.send(sender=self.model, recipe=recipe)
+        changed = [i.ingredient_id for i in to_update + to_create]
+        if changed:
+            ShoppingListItem.objects.refresh(
+                Purchase.purchase.filter(
+                    recipe=recipe).values_list('user', flat=True),
+                changed)
+
+
 class Ingredient(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Product, on_delete=models.CASCADE)
     amount = models.FloatField(verbose_name='Количество ингредиента')
 
+    objects = IngredientManager()
+
     class Meta:
         unique_together = ('ingredient', 'amount', 'recipe')
 
@@ -72,69 +347,134 @@ class Ingredient(models.Model):
         return f'{self.amount}'
 
 
-class PurchaseManager(models.Manager):
-    def counter(self, user):
-        try:
-            return super().get_queryset().get(user=user).recipes.count()
-        except ObjectDoesNotExist:
-            return 0
+class UserRecipeManager(models.Manager):
+    """Связи пользователя с рецептами: одна строка на пару."""
 
-    def get_purchases_list(self, user):
+    def add(self, user, recipe):
+        """Добавляет рецепт; возвращает False, если он уже добавлен."""
         try:
-            return super().get_queryset().get(user=user).recipes.all()
-        except ObjectDoesNotExist:
-            return []
+            with transaction.atomic():
+                self.create(user=user, recipe=recipe)
+        except IntegrityError:
+            return False
+        return True
+
+    def remove(self, user, recipe):
+        """Удаляет рецепт; возвращает False, если его не было."""
+        deleted, _ = super().get_queryset().filter(
+            user=user, recipe=recipe).delete()
+        return bool(deleted)
+
+    def recipes_of(self, user):
+        # Рецепты в порядке добавления, по индексу (user, created_at)
+        return Recipe.recipes.filter(
+            **{f'{self.model._meta.model_name}__user': user}
+        ).order_by(
+            f'-{self.model._meta.model_name}__created_at',
+            f'-{self.model._meta.model_name}__pk')
+
+
+class UserRecipe(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Время добавления')
 
-    def get_user_purchase(self, user):
-        try:
-            return super().get_queryset().get(user=user)
-        except ObjectDoesNotExist:
-            purchase = Purchase(user=user)
-            purchase.save()
-            return purchase
+    class Meta:
+        abstract = True
 
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class PurchaseManager(UserRecipeManager):
+    def counter(self, user):
+        count = AuthorStats.objects.filter(
+            user=user
+        ).values_list('purchases_count', flat=True).first()
+        return count or 0
+
+    def get_purchases_list(self, user):
+        return self.recipes_of(user)
 
-class Purchase(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    recipes = models.ManyToManyField(Recipe)
 
+class Purchase(UserRecipe):
     purchase = PurchaseManager()
 
+    class Meta(UserRecipe.Meta):
+        constraints = [models.UniqueConstraint(
+            fields=('user', 'recipe'), name='purchase_user_recipe')]
+        # Список пользователя читается из индекса без обращения к таблице
+        indexes = [models.Index(
+            fields=('user', 'created_at', 'recipe'),
+            name='purchase_user_created')]
 
-class FavoriteManager(models.Manager):
+
+class FavoriteManager(UserRecipeManager):
     def get_favorites(self, user):
-        try:
-            return super().get_queryset().get(user=user).recipes.all()
-        except ObjectDoesNotExist:
-            return []
+        return self.recipes_of(user)
 
     def get_tag_filtered(self, user, tags):
-        try:
-            recipes = super().get_queryset().get(user=user).recipes.all()
-            if tags:
-                return recipes.prefetch_related(
-                    'author', 'tags'
-                ).filter(
-                    tags__slug__in=tags
-                ).distinct()
-            else:
-                return recipes.prefetch_related(
-                    'author', 'tags'
-                ).all()
-        except ObjectDoesNotExist:
-            return []
+        return Recipe.recipes.tag_filter(tags).filter(favorite__user=user)
 
-    def get_user(self, user):
-        try:
-            return super().get_queryset().get(user=user)
-        except ObjectDoesNotExist:
-            favorite_user = Favorite(user=user)
-            favorite_user.save()
-            return favorite_user
 
+class Favorite(UserRecipe):
+    favorite = FavoriteManager()
 
-class Favorite(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    recipes = models.ManyToManyField(Recipe)
+    class Meta(UserRecipe.Meta):
+        constraints = [models.UniqueConstraint(
+            fields=('user', 'recipe'), name='favorite_user_recipe')]
+        indexes = [models.Index(
+            fields=('user', 'created_at', 'recipe'),
+            name='favorite_user_created')]
+
+
+class ShoppingListManager(models.Manager):
+    def refresh(self, users, products=None):
+        """
+        Пересчитывает строки списка покупок для пар (пользователь, продукт).
+
+        Если продукты не переданы, пересчитывается весь список пользователей.
+        """
+        users = list(users)
+        if not users:
+            return
+        ingredients = Ingredient.objects.filter(
+            recipe__purchase__user__in=users)
+        items = super().get_queryset().filter(user__in=users)
+        if products is not None:
+            products = list(products)
+            if not products:
+                return
+            ingredients = ingredients.filter(ingredient__in=products)
+            items = items.filter(product__in=products)
+        rows = ingredients.values(
+            'recipe__purchase__user', 'ingredient'
+        ).annotate(total=models.Sum('amount')).order_by()
+        with transaction.atomic():
+            items.delete()
+            self.bulk_create(
+                self.model(user_id=row['recipe__purchase__user'],
+                           product_id=row['ingredient'],
+                           amount=row['total'])
+                for row in rows)
+
+    def rebuild(self):
+        users = Purchase.purchase.values_list('user', flat=True).distinct()
+        with transaction.atomic():
+            super().get_queryset().all().delete()
+            self.refresh(users)
+
+
+class ShoppingListItem(models.Model):
+    """Сводный список покупок пользователя, поддерживается сигналами."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='shopping_list')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    amount = models.FloatField(verbose_name='Количество')
+
+    objects = ShoppingListManager()
 
-    favorite = FavoriteManager()
+    class Meta:
+        unique_together = ('user', 'product')
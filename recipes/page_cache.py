@@ -0,0 +1,106 @@
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from foodgram.routers import primary
+
+
+VERSION_KEY = 'recipes:pages:version'
+CACHED_PARAMS = {'tag', 'cursor', 'page'}
+
+# Причины не кэшировать то, что отрисовывается в текущем track_uncacheable
+_uncacheable = ContextVar('recipes_uncacheable', default=None)
+
+
+def get_pages_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Время, а не 1: после вытеснения ключа старые страницы не оживут.
+        # Без срока: страницы сбрасываются только изменениями
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+@contextmanager
+def track_uncacheable():
+    """
+    Собирает причины, по которым отрисованный HTML нельзя класть в кэш.
+
+    Например, миниатюры изображения еще создаются, и вместо них выводится
+    исходный файл. Причины попадают и во внешний track_uncacheable.
+    """
+    outer = _uncacheable.get()
+    reasons = set()
+    token = _uncacheable.set(reasons)
+    try:
+        yield reasons
+    finally:
+        _uncacheable.reset(token)
+        if outer is not None:
+            outer.update(reasons)
+
+
+def mark_uncacheable(reason):
+    reasons = _uncacheable.get()
+    if reasons is not None:
+        reasons.add(reason)
+
+
+def bump_pages_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_pages_version()
+
+
+def _page_key(request, view, kwargs):
+    tags = sorted(set(request.GET.getlist('tag')))
+    parts = [
+        view.__module__, view.__name__, get_pages_version(),
+        sorted(kwargs.items()), tags,
+        request.GET.get('cursor'), request.GET.get('page'),
+    ]
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'recipes:page:{digest}'
+
+
+def anonymous_page_cache(view):
+    """
+    Кэширует страницу целиком для неавторизованных пользователей.
+
+    Ключ строится из набора тегов без учета порядка и повторов, курсора
+    страницы и версии, которая увеличивается при изменении рецептов, тегов
+    и ингредиентов.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.user.is_authenticated
+                or request.method not in ('GET', 'HEAD')
+                or set(request.GET) - CACHED_PARAMS):
+            return view(request, *args, **kwargs)
+        key = _page_key(request, view, kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        # Страница живет в кэше под текущей версией, поэтому строится по
+        # основной базе: реплика может еще не видеть изменение
+        with primary(), track_uncacheable() as uncacheable:
+            response = view(request, *args, **kwargs)
+        if (response.status_code == 200 and not uncacheable
+                and not response.streaming
+                and not response.cookies
+                and not request.META.get('CSRF_COOKIE_USED')):
+            cache.set(key, (response.content, response['Content-Type']),
+                      settings.PAGE_CACHE_TIMEOUT)
+        return response
+
+    return wrapper
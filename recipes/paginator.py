@@ -0,0 +1,184 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+COUNT_CACHE_TIMEOUT = 60
+# Номера страниц больше этого считаются некорректными: смещение в запросе
+# не должно выходить за целое базы
+MAX_PAGE = 10 ** 6
+# Верхняя граница AutoField
+MAX_PK = 2 ** 31 - 1
+
+
+def _encode_cursor(recipe, number, backward=False):
+    data = [recipe.pub_date.isoformat(), recipe.pk, number, int(backward)]
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        pub_date, pk, number, backward = json.loads(raw)
+        pub_date = parse_datetime(pub_date)
+        pk, number = int(pk), max(int(number), 1)
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    # Поддельный курсор с огромным числом не должен доходить до запроса
+    if pub_date is None or not 0 < pk <= MAX_PK or number > MAX_PAGE:
+        return None
+    return pub_date, pk, number, bool(backward)
+
+
+class KeysetPage:
+    def __init__(self, object_list, number, has_previous, has_next,
+                 paginator):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    @property
+    def previous_cursor(self):
+        # На первую страницу ведет ссылка без курсора
+        if not self._has_previous or self.number <= 2 or not self:
+            return None
+        return _encode_cursor(
+            self.object_list[0], self.number - 1, backward=True)
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return _encode_cursor(self.object_list[-1], self.number + 1)
+
+
+class KeysetPaginator:
+    """
+    Пагинация по курсору (pub_date, id) вместо OFFSET + COUNT.
+
+    Страница выбирается условием по индексированным полям, поэтому любая
+    страница стоит столько же, сколько первая. Общее количество записей
+    нужно только для виджета и берется из кэша.
+    """
+
+    ordering = ('-pub_date', '-pk')
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def get_page(self, cursor):
+        position = _decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self._forward(self.queryset, 1, has_previous=False)
+        pub_date, pk, number, backward = position
+        if backward:
+            queryset = self.queryset.filter(
+                Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+            ).order_by('pub_date', 'pk')
+            items = list(queryset[:self.per_page + 1])
+            if len(items) <= self.per_page:
+                # Дошли до начала списка: отдаем обычную первую страницу
+                return self._forward(self.queryset, 1, has_previous=False)
+            items = items[:self.per_page][::-1]
+            return KeysetPage(items, number, True, True, self)
+        queryset = self.queryset.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+        return self._forward(queryset, number, has_previous=True)
+
+    def _forward(self, queryset, number, has_previous):
+        items = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+        has_next = len(items) > self.per_page
+        return KeysetPage(
+            items[:self.per_page], number, has_previous, has_next, self)
+
+    @cached_property
+    def count(self):
+        try:
+            query = str(self.queryset.query).encode()
+        except EmptyResultSet:
+            return 0
+        key = f'recipes:count:{hashlib.md5(query).hexdigest()}'
+        return cache.get_or_set(
+            key, self.queryset.count, COUNT_CACHE_TIMEOUT)
+
+    @cached_property
+    def num_pages(self):
+        return max(-(-self.count // self.per_page), 1)
+
+
+class NumberedPage(KeysetPage):
+    # Курсор - просто номер страницы
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or self.number <= 2:
+            return None
+        return str(self.number - 1)
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return str(self.number + 1)
+
+
+class SearchPaginator:
+    """
+    Пагинация результатов поиска, упорядоченных по релевантности.
+
+    Порядок задает текстовый индекс, поэтому страницы выбираются через
+    LIMIT/OFFSET, а в ссылках передается номер страницы.
+    """
+
+    def __init__(self, results, per_page):
+        self.results = results
+        self.per_page = per_page
+
+    def get_page(self, cursor):
+        try:
+            number = int(cursor)
+        except (TypeError, ValueError):
+            number = 1
+        if not 1 <= number <= MAX_PAGE:
+            number = 1
+        items = self.results.fetch(
+            (number - 1) * self.per_page, self.per_page + 1)
+        return NumberedPage(
+            items[:self.per_page], number, number > 1,
+            len(items) > self.per_page, self)
+
+    @cached_property
+    def count(self):
+        return self.results.count()
+
+    @cached_property
+    def num_pages(self):
+        return max(-(-self.count // self.per_page), 1)
@@ -0,0 +1,257 @@
+import hashlib
+import re
+from collections import defaultdict
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import Q
+
+from .autocomplete import normalize
+from .models import Ingredient, Product, Recipe
+from .page_cache import get_pages_version
+from .stemmer import stem
+
+
+SEARCH_TABLE = 'recipes_recipe_search'
+MAX_QUERY_TERMS = 8
+MIN_PREFIX_LENGTH = 3
+BATCH_SIZE = 1000
+COUNT_CACHE_TIMEOUT = 60
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))[:MAX_QUERY_TERMS]
+
+
+def stem_text(text):
+    return ' '.join(stem(token) for token in _TOKEN.findall(normalize(text)))
+
+
+def _prefix(expression, term, suffix):
+    # Короткие термы как префикс совпадают с большей частью индекса
+    if len(term) < MIN_PREFIX_LENGTH:
+        return expression
+    return expression + suffix
+
+
+def _documents(ids):
+    ingredients = defaultdict(list)
+    for recipe_id, title in Ingredient.objects.filter(
+            recipe_id__in=ids).values_list('recipe_id', 'ingredient__title'):
+        ingredients[recipe_id].append(title)
+    for pk, name, description in Recipe.recipes.filter(
+            pk__in=ids).values_list('pk', 'name', 'description'):
+        yield pk, name, description, ' '.join(ingredients[pk])
+
+
+class SqliteSearchBackend:
+    """
+    Индекс FTS5 с заранее выделенными основами слов.
+
+    FTS5 не умеет склонять русские слова, поэтому в индекс и в запрос
+    попадают основы из recipes.stemmer, а каждый терм ищется как префикс.
+    """
+
+    def update(self, ids):
+        rows = [
+            (pk, stem_text(name), stem_text(description),
+             stem_text(ingredients))
+            for pk, name, description, ingredients in _documents(ids)]
+        with connection.cursor() as cursor:
+            self._delete(cursor, ids)
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} '
+                f'(rowid, name, description, ingredients) '
+                f'VALUES (%s, %s, %s, %s)', rows)
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            self._delete(cursor, ids)
+
+    def _delete(self, cursor, ids):
+        ids = list(ids)
+        if ids:
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})',
+                ids)
+
+    def _match(self, terms):
+        return ' '.join(
+            _prefix(f'"{stem(term)}"', term, '*') for term in terms)
+
+    def search(self, terms, offset, limit):
+        # rank настроен в миграции: bm25 с весами name > ingredients
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+                [self._match(terms), limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, terms):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s', [self._match(terms)])
+            return cursor.fetchone()[0]
+
+
+class PostgresSearchBackend:
+    """tsvector с конфигурацией russian и GIN-индексом."""
+
+    def update(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (recipe_id, document) '
+                f'SELECT r.id, '
+                f"setweight(to_tsvector('russian', r.name), 'A') || "
+                f"setweight(to_tsvector('russian', r.description), 'B') || "
+                f"setweight(to_tsvector('russian', "
+                f"coalesce(string_agg(p.title, ' '), '')), 'C') "
+                f'FROM {Recipe._meta.db_table} r '
+                f'LEFT JOIN {Ingredient._meta.db_table} i '
+                f'ON i.recipe_id = r.id '
+                f'LEFT JOIN {Product._meta.db_table} p '
+                f'ON p.id = i.ingredient_id '
+                f'WHERE r.id = ANY(%s) GROUP BY r.id '
+                f'ON CONFLICT (recipe_id) '
+                f'DO UPDATE SET document = EXCLUDED.document', [ids])
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE recipe_id = ANY(%s)',
+                [list(ids)])
+
+    def _query(self, terms):
+        return ' & '.join(_prefix(term, term, ':*') for term in terms)
+
+    def search(self, terms, offset, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT recipe_id FROM {SEARCH_TABLE}, '
+                f"to_tsquery('russian', %s) query "
+                f'WHERE document @@ query '
+                f'ORDER BY ts_rank(document, query) DESC, recipe_id DESC '
+                f'LIMIT %s OFFSET %s', [self._query(terms), limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, terms):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {SEARCH_TABLE} '
+                f"WHERE document @@ to_tsquery('russian', %s)",
+                [self._query(terms)])
+            return cursor.fetchone()[0]
+
+
+class FallbackSearchBackend:
+    """
+    Поиск без текстового индекса: LIKE по основам слов.
+
+    Используется, если база не поддерживает FTS5 или tsvector. Результаты
+    упорядочены по дате публикации, а не по релевантности.
+    """
+
+    def update(self, ids):
+        pass
+
+    def remove(self, ids):
+        pass
+
+    def _queryset(self, terms):
+        queryset = Recipe.recipes.all()
+        for term in terms:
+            term = stem(term)
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(description__icontains=term)
+                | Q(ingredients__title__icontains=term))
+        return queryset.distinct()
+
+    def search(self, terms, offset, limit):
+        return list(self._queryset(terms).order_by(
+            '-pub_date', '-pk'
+        ).values_list('pk', flat=True)[offset:offset + limit])
+
+    def count(self, terms):
+        return self._queryset(terms).count()
+
+
+class SearchIndex:
+    def __init__(self):
+        self._backends = {}
+
+    @property
+    def backend(self):
+        # Наличие таблицы индекса проверяется один раз для каждой базы
+        key = connection.settings_dict['NAME']
+        backend = self._backends.get(key)
+        if backend is None:
+            backend = self._backends[key] = self._detect()
+        return backend
+
+    def _detect(self):
+        try:
+            tables = connection.introspection.table_names()
+        except OperationalError:
+            tables = []
+        if SEARCH_TABLE not in tables:
+            return FallbackSearchBackend()
+        if connection.vendor == 'postgresql':
+            return PostgresSearchBackend()
+        return SqliteSearchBackend()
+
+    def update(self, ids):
+        ids = iter(ids)
+        batch = list(islice(ids, BATCH_SIZE))
+        while batch:
+            self.backend.update(batch)
+            batch = list(islice(ids, BATCH_SIZE))
+
+    def remove(self, ids):
+        self.backend.remove(list(ids))
+
+    def rebuild(self):
+        self.update(Recipe.recipes.order_by(
+            'pk').values_list('pk', flat=True).iterator())
+
+    def search(self, query):
+        return SearchResults(self.backend, tokenize(query))
+
+
+class SearchResults:
+    """Результаты поиска, которые загружаются по страницам."""
+
+    def __init__(self, backend, terms):
+        self.backend = backend
+        self.terms = terms
+
+    def count(self):
+        if not self.terms:
+            return 0
+        # Версия страниц меняется с каждым рецептом, поэтому число
+        # найденных не переживает добавление или удаление рецепта
+        parts = [get_pages_version(), self.terms]
+        digest = hashlib.md5(repr(parts).encode()).hexdigest()
+        return cache.get_or_set(
+            f'recipes:search-count:{digest}',
+            lambda: self.backend.count(self.terms), COUNT_CACHE_TIMEOUT)
+
+    def fetch(self, offset, limit):
+        if not self.terms:
+            return []
+        ids = self.backend.search(self.terms, offset, limit)
+        recipes = Recipe.recipes.filter(
+            pk__in=ids).prefetch_related('author', 'tags').in_bulk()
+        return [recipes[pk] for pk in ids if pk in recipes]
+
+
+search_index = SearchIndex()
@@ -0,0 +1,140 @@
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from users.models import Subscription
+
+from .autocomplete import product_index
+from .cookable import cookable_index
+from .models import (AuthorStats, Favorite, Ingredient, Product, Purchase,
+                     Recipe, ShoppingListItem, Tag, User)
+from .page_cache import bump_pages_version
+from .search import search_index
+
+
+SEED_PREFIX = 'seed'
+BATCH_SIZE = 5000
+
+DEFAULT_TAGS = {
+    'breakfast': 'завтрак',
+    'lunch': 'обед',
+    'dinner': 'ужин',
+}
+
+
+def seed_username(number):
+    return f'{SEED_PREFIX}-user-{number}'
+
+
+def _bulk_create(manager, objects):
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, BATCH_SIZE))
+        if not batch:
+            return
+        manager.bulk_create(batch, batch_size=BATCH_SIZE)
+
+
+def _bulk_through(field, rows):
+    through = field.through
+    _bulk_create(through.objects, (through(**row) for row in rows))
+
+
+def _ensure_tags(count):
+    slugs = list(DEFAULT_TAGS) + [f'tag{i}' for i in range(3, count)]
+    tags = []
+    for slug in slugs[:count]:
+        tag, _ = Tag.objects.get_or_create(
+            slug=slug, defaults={'name': DEFAULT_TAGS.get(slug, slug)})
+        tags.append(tag)
+    return tags
+
+
+def _ensure_products(count):
+    products = list(Product.objects.order_by('pk')[:count])
+    if len(products) < count:
+        Product.objects.bulk_create(
+            Product(title=f'{SEED_PREFIX} продукт {i}', unit='г')
+            for i in range(len(products), count))
+        product_index.invalidate()
+        products = list(Product.objects.order_by('pk')[:count])
+    return products
+
+
+@transaction.atomic
+def seed(users=50, recipes=1000, ingredients=8, tags=3, products=500,
+         favorites=30, purchases=10, subscriptions=10, random_seed=42):
+    """
+    Создает детерминированный набор данных для нагрузочных замеров.
+
+    Одинаковые параметры и random_seed дают одинаковые данные. Записи
+    создаются пакетно, поэтому денормализованные поля (маска тегов,
+    счетчики, сводные списки покупок) заполняются здесь же, а не сигналами.
+    Пользователи получают имена seed-user-N и непригодный пароль.
+    """
+    rnd = random.Random(random_seed)
+    tags = _ensure_tags(tags)
+    products = _ensure_products(products)
+    password = make_password(None)
+    User.objects.bulk_create(
+        (User(username=seed_username(i), email=f'{seed_username(i)}@test',
+              password=password) for i in range(users)),
+        batch_size=BATCH_SIZE)
+    user_ids = list(User.objects.filter(
+        username__startswith=f'{SEED_PREFIX}-user-'
+    ).order_by('pk').values_list('pk', flat=True))[-users:]
+
+    recipe_tags = []
+    new_recipes = []
+    for i in range(recipes):
+        chosen = rnd.sample(tags, rnd.randint(1, len(tags)))
+        recipe_tags.append(chosen)
+        new_recipes.append(Recipe(
+            author_id=rnd.choice(user_ids),
+            name=f'{rnd.choice(products).title.capitalize()} №{i}',
+            description='Описание рецепта', cook_time=rnd.randint(5, 120),
+            tag_mask=sum(tag.mask for tag in chosen)))
+    Recipe.recipes.bulk_create(new_recipes, batch_size=BATCH_SIZE)
+    recipe_ids = list(Recipe.recipes.filter(
+        author_id__in=user_ids
+    ).order_by('pk').values_list('pk', flat=True))[-recipes:]
+    _bulk_through(Recipe.tags, (
+        {'recipe_id': pk, 'tag_id': tag.pk}
+        for pk, chosen in zip(recipe_ids, recipe_tags) for tag in chosen))
+    Ingredient.objects.bulk_create(
+        (Ingredient(recipe_id=pk, ingredient=product,
+                    amount=rnd.randint(1, 500))
+         for pk in recipe_ids
+         for product in rnd.sample(products, min(ingredients, len(products)))),
+        batch_size=BATCH_SIZE)
+
+    def pick(count):
+        return rnd.sample(recipe_ids, min(count, len(recipe_ids)))
+
+    _bulk_create(Favorite.favorite, (
+        Favorite(user_id=user, recipe_id=recipe)
+        for user in user_ids for recipe in pick(favorites)))
+    _bulk_create(Purchase.purchase, (
+        Purchase(user_id=user, recipe_id=recipe)
+        for user in user_ids for recipe in pick(purchases)))
+    Subscription.objects.bulk_create(
+        (Subscription(user_id=user, author_id=author)
+         for user in user_ids
+         for author in rnd.sample(user_ids, min(subscriptions, users))
+         if author != user),
+        batch_size=BATCH_SIZE)
+
+    Recipe.recipes.recount(recipe_ids)
+    AuthorStats.objects.recount(user_ids)
+    ShoppingListItem.objects.refresh(user_ids)
+    search_index.update(recipe_ids)
+    cookable_index.invalidate()
+    bump_pages_version()
+    return {
+        'users': len(user_ids),
+        'recipes': len(recipe_ids),
+        'tags': len(tags),
+        'products': len(products),
+    }
@@ -0,0 +1,302 @@
+from django.contrib.flatpages.models import FlatPage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.db.models.signals import (m2m_changed, post_delete,
+                                      post_migrate, post_save, pre_save)
+from django.dispatch import receiver
+
+from foodgram.refdata import invalidate_all
+from users.models import Subscription
+
+from .autocomplete import product_index
+from .conditional import bump_viewer_versions
+from .cookable import cookable_index
+from .flatpages import cached_flatpages
+from .models import (AuthorStats, Favorite, Ingredient, Product, Purchase,
+                     Recipe, ShoppingListItem, Tag, User, cached_tags,
+                     ingredients_changed)
+from .page_cache import bump_pages_version
+from .search import search_index
+from .thumbnails import make_placeholder, thumbnail_pool
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def reset_product_index(sender, **kwargs):
+    product_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def reset_cached_tags(sender, **kwargs):
+    cached_tags.invalidate()
+
+
+@receiver(post_save, sender=FlatPage)
+@receiver(post_delete, sender=FlatPage)
+@receiver(m2m_changed, sender=FlatPage.sites.through)
+def reset_cached_flatpages(sender, **kwargs):
+    cached_flatpages.invalidate()
+
+
+@receiver(post_migrate)
+def reset_refdata(sender, **kwargs):
+    # Миграции с данными работают с историческими моделями без сигналов
+    invalidate_all()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def reset_cached_pages(sender, **kwargs):
+    bump_pages_version()
+
+
+def _row_delta(kwargs):
+    # +1 для новой строки, -1 для удаленной, 0 при повторном сохранении
+    if kwargs['signal'] is post_delete:
+        return -1
+    return 1 if kwargs['created'] and not kwargs.get('raw') else 0
+
+
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+def update_purchase_counter(sender, instance, **kwargs):
+    delta = _row_delta(kwargs)
+    if delta:
+        AuthorStats.objects.shift(
+            'purchases_count', {instance.user_id: delta})
+
+
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+def update_shopping_list(sender, instance, **kwargs):
+    # При удалении рецепта его ингредиенты могут удалиться раньше покупок;
+    # тогда список уже пересчитан сигналом ингредиента
+    if _row_delta(kwargs):
+        ShoppingListItem.objects.refresh(
+            [instance.user_id], Ingredient.objects.filter(
+                recipe_id=instance.recipe_id
+            ).values_list('ingredient', flat=True))
+
+
+def _purchased_by(recipe_id):
+    return Purchase.purchase.filter(
+        recipe=recipe_id).values_list('user', flat=True)
+
+
+@receiver(pre_save, sender=Ingredient)
+def remember_ingredient_product(sender, instance, **kwargs):
+    instance._old_product = None
+    if instance.pk is not None:
+        instance._old_product = Ingredient.objects.filter(
+            pk=instance.pk).values_list('ingredient', flat=True).first()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_shopping_lists_for_ingredient(sender, instance, **kwargs):
+    products = {instance.ingredient_id,
+                getattr(instance, '_old_product', None)} - {None}
+    ShoppingListItem.objects.refresh(
+        _purchased_by(instance.recipe_id), products)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tag_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_recipes = list(
+            instance.recipe_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Recipe.recipes.update_tag_masks([instance.pk])
+    elif action == 'post_clear':
+        Recipe.recipes.update_tag_masks(instance._cleared_recipes)
+    else:
+        Recipe.recipes.update_tag_masks(pk_set)
+
+
+@receiver(post_delete, sender=Tag)
+def drop_tag_bit(sender, instance, **kwargs):
+    Recipe.recipes.annotate(
+        tag_match=F('tag_mask').bitand(instance.mask)
+    ).filter(tag_match__gt=0).update(
+        tag_mask=F('tag_mask') - instance.mask, modified=Now())
+
+
+@receiver(pre_save, sender=Recipe)
+def update_image_placeholder(sender, instance, raw=False, **kwargs):
+    # Новый файл еще не записан в хранилище и читается из загрузки
+    instance._image_changed = False
+    if raw:
+        return
+    if not instance.image:
+        instance.image_placeholder = ''
+    elif not instance.image._committed:
+        instance.image_placeholder = make_placeholder(instance.image.file)
+        instance._image_changed = True
+
+
+@receiver(post_save, sender=Recipe)
+def pregenerate_thumbnails(sender, instance, update_fields=None, **kwargs):
+    # Миниатюры старого изображения уже есть или стоят в очереди
+    if not instance._image_changed or not thumbnail_pool.enabled:
+        return
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    name = instance.image.name
+    transaction.on_commit(lambda: thumbnail_pool.submit(name))
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {
+            'name', 'description'} & set(update_fields):
+        return
+    search_index.update([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def index_recipe_ingredients(sender, instance, **kwargs):
+    search_index.update([instance.recipe_id])
+
+
+@receiver(ingredients_changed)
+def index_synced_ingredients(sender, recipe, **kwargs):
+    search_index.update([recipe.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    search_index.remove([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def reindex_product_recipes(sender, instance, created, **kwargs):
+    if not created:
+        search_index.update(Ingredient.objects.filter(
+            ingredient=instance
+        ).values_list('recipe_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_cookable_index(sender, instance, **kwargs):
+    cookable_index.changed([instance.recipe_id])
+
+
+@receiver(ingredients_changed)
+def update_cookable_synced(sender, recipe, **kwargs):
+    cookable_index.changed([recipe.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def drop_cookable_recipe(sender, instance, **kwargs):
+    cookable_index.changed([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def touch_recipe_for_ingredient(sender, instance, **kwargs):
+    Recipe.recipes.touch([instance.recipe_id])
+
+
+@receiver(ingredients_changed)
+def touch_synced_recipe(sender, recipe, **kwargs):
+    Recipe.recipes.touch([recipe.pk])
+
+
+@receiver(post_save, sender=Product)
+def touch_product_recipes(sender, instance, created, **kwargs):
+    if not created:
+        Recipe.recipes.touch(Ingredient.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+def touch_tag_recipes(sender, instance, created, **kwargs):
+    if not created:
+        Recipe.recipes.touch(Recipe.tags.through.objects.filter(
+            tag=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+def bump_recipe_owner(sender, instance, **kwargs):
+    if _row_delta(kwargs):
+        bump_viewer_versions([instance.user_id])
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_subscriber(sender, instance, **kwargs):
+    bump_viewer_versions([instance.user_id])
+
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    Purchase: 'purchases_count',
+}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+def update_recipe_counters(sender, instance, **kwargs):
+    delta = _row_delta(kwargs)
+    if delta:
+        Recipe.recipes.shift_counter(
+            RECIPE_COUNTERS[sender], {instance.recipe_id: delta})
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def count_new_recipe(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.shift('recipes_count', {instance.author_id: 1})
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_recipe(sender, instance, **kwargs):
+    AuthorStats.objects.shift('recipes_count', {instance.author_id: -1})
+
+
+def _shift_subscription(subscription, delta):
+    AuthorStats.objects.shift(
+        'followers_count', {subscription.author_id: delta})
+    AuthorStats.objects.shift(
+        'following_count', {subscription.user_id: delta})
+
+
+@receiver(post_save, sender=Subscription)
+def count_subscription(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _shift_subscription(instance, 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def uncount_subscription(sender, instance, **kwargs):
+    _shift_subscription(instance, -1)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def reset_subscription_pages(sender, instance, **kwargs):
+    # После счетчиков: шапки профилей автора и подписчика показывают число
+    # подписчиков и подписок
+    bump_pages_version()
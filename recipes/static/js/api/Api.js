@@ -1,7 +1,11 @@
 
+const TOGGLE_DELAY = 100;
+
 class Api {
     constructor(apiUrl) {
         this.apiUrl =  apiUrl;
+        this.pending = [];
+        this.timer = null;
     }
   getPurchases () {
     return fetch(`/purchases`, {
@@ -17,47 +21,48 @@ class Api {
       })
   }
   addPurchases (id) {
-    return fetch(`/purchases`, {
-      method: 'POST',
-      headers: {
-        'X-CSRFToken': document.getElementsByName('csrfmiddlewaretoken')[0].value,
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify({
-        id: id
-      })
-    })
-      .then( e => {
-          if(e.ok) {
-              return e.json()
-          }
-          return Promise.reject(e.statusText)
-      })
+    return this.toggle('purchases', 'add', id)
   }
   removePurchases (id){
-    return fetch(`/purchases/${id}`, {
-      method: 'DELETE',
-      headers: {
-        'X-CSRFToken': document.getElementsByName('csrfmiddlewaretoken')[0].value,
-        'Content-Type': 'application/json'
+    return this.toggle('purchases', 'remove', id)
+  }
+  addSubscriptions(id) {
+    return this.toggle('subscriptions', 'add', id)
+  }
+  removeSubscriptions (id) {
+    return this.toggle('subscriptions', 'remove', id)
+  }
+  addFavorites (id)  {
+    return this.toggle('favorites', 'add', id)
+  }
+  removeFavorites (id) {
+    return this.toggle('favorites', 'remove', id)
+  }
+  // Нажатия за TOGGLE_DELAY мс отправляются одним запросом на /toggles
+  toggle (collection, action, id) {
+    return new Promise((resolve, reject) => {
+      this.pending.push({
+        operation: {collection: collection, action: action, id: id},
+        resolve: resolve,
+        reject: reject
+      })
+      if (!this.timer) {
+        this.timer = setTimeout(() => this.flushToggles(), TOGGLE_DELAY)
       }
     })
-      .then( e => {
-          if(e.ok) {
-              return e.json()
-          }
-          return Promise.reject(e.statusText)
-      })
   }
-  addSubscriptions(id) {
-    return fetch(`/subscriptions`, {
+  flushToggles () {
+    const pending = this.pending
+    this.pending = []
+    this.timer = null
+    return fetch(`/toggles`, {
       method: 'POST',
       headers: {
         'X-CSRFToken': document.getElementsByName('csrfmiddlewaretoken')[0].value,
         'Content-Type': 'application/json'
       },
       body: JSON.stringify({
-        id: id
+        operations: pending.map(item => item.operation)
       })
     })
       .then( e => {
@@ -66,54 +71,10 @@ class Api {
           }
           return Promise.reject(e.statusText)
       })
-  }
-  removeSubscriptions (id) {
-    return fetch(`/subscriptions/${id}`, {
-      method: 'DELETE',
-      headers: {
-        'X-CSRFToken': document.getElementsByName('csrfmiddlewaretoken')[0].value,
-        'Content-Type': 'application/json'
-      }
-    })
-      .then( e => {
-          if(e.ok) {
-              return e.json()
-          }
-          return Promise.reject(e.statusText)
-      })
-  }
-  addFavorites (id)  {
-    return fetch(`/favorites`, {
-      method: 'POST',
-      headers: {
-        'X-CSRFToken': document.getElementsByName('csrfmiddlewaretoken')[0].value,
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify({
-        id: id
-      })
-    })
-        .then( e => {
-            if(e.ok) {
-                return e.json()
-            }
-            return Promise.reject(e.statusText)
-        })
-  }
-  removeFavorites (id) {
-    return fetch(`/favorites/${id}`, {
-      method: 'DELETE',
-      headers: {
-        'X-CSRFToken': document.getElementsByName('csrfmiddlewaretoken')[0].value,
-        'Content-Type': 'application/json'
-      }
-    })
-        .then( e => {
-            if(e.ok) {
-                return e.json()
-            }
-            return Promise.reject(e.statusText)
-        })
+      .then(
+          data => pending.forEach(item => item.resolve(data)),
+          error => pending.forEach(item => item.reject(error))
+      )
   }
     getIngredients  (text)  {
         return fetch(`/ingredients?query=${text}`, {
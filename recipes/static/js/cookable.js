@@ -0,0 +1,53 @@
+const cookableForm = document.querySelector('#cookableForm');
+const productGroup = cookableForm.querySelector('.form__field-group');
+const nameProduct = document.querySelector('#nameIngredient');
+const productDropdown = document.querySelector('.form__dropdown-items');
+const addProduct = document.querySelector('#addIng');
+
+// выбор продукта из подсказок
+productDropdown.addEventListener('click', (e) => {
+    if (e.target.classList.contains('form__item-list')) {
+        nameProduct.value = e.target.textContent;
+        productDropdown.style.display = '';
+    }
+});
+
+// добавление продукта в список
+addProduct.addEventListener('click', () => {
+    const title = nameProduct.value.trim();
+    if (!title) {
+        return;
+    }
+    const elem = document.createElement('div');
+    elem.classList.add('form__field-item-ingredient');
+    elem.innerHTML = `<span></span> <span class="form__field-item-delete"></span>
+                      <input name="product" type="hidden">`;
+    elem.querySelector('span').textContent = title;
+    elem.querySelector('input').value = title;
+    addProduct.insertAdjacentElement('afterend', elem);
+    nameProduct.value = '';
+});
+
+// удаление продукта из списка
+productGroup.addEventListener('click', (e) => {
+    if (e.target.classList.contains('form__field-item-delete')) {
+        e.target.closest('.form__field-item-ingredient').remove();
+    }
+});
+
+// подсказки из того же автодополнения, что и в форме рецепта
+const cbProductInput = (elem) => {
+    return api.getIngredients(elem.target.value).then( e => {
+        if (e.length !== 0) {
+            productDropdown.innerHTML = e.map( item => {
+                return `<a class="form__item-list">${item.title}</a>`
+            }).join(' ');
+            productDropdown.style.display = 'flex';
+        }
+    })
+    .catch( e => {
+        console.log(e)
+    })
+};
+
+nameProduct.addEventListener('input', debouncing(cbProductInput, 1000));
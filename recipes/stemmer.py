@@ -0,0 +1,58 @@
+import re
+
+
+# Стеммер Портера для русского языка (алгоритм Snowball)
+_VOWELS = 'аеиоуыэюя'
+_RV = re.compile(f'^(.*?[{_VOWELS}])(.*)$')
+_PERFECTIVE_GERUND = re.compile(
+    '((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile('(с[яь])$')
+_ADJECTIVE = re.compile(
+    '(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    'ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile('((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    '((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    '((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+_NOUN = re.compile(
+    '(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+_DERIVATIONAL = re.compile(f'.*[^{_VOWELS}]+[{_VOWELS}].*ость?$')
+_DER = re.compile('ость?$')
+_SUPERLATIVE = re.compile('(ейше|ейш)$')
+_I = re.compile('и$')
+
+
+def _strip(pattern, word):
+    return pattern.sub('', word, 1)
+
+
+def stem(word):
+    """Возвращает основу русского слова в нижнем регистре."""
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    stripped = _strip(_PERFECTIVE_GERUND, rv)
+    if stripped == rv:
+        rv = _strip(_REFLEXIVE, rv)
+        stripped = _strip(_ADJECTIVE, rv)
+        if stripped != rv:
+            rv = _strip(_PARTICIPLE, stripped)
+        else:
+            stripped = _strip(_VERB, rv)
+            rv = _strip(_NOUN, rv) if stripped == rv else stripped
+    else:
+        rv = stripped
+    rv = _strip(_I, rv)
+    if _DERIVATIONAL.match(rv):
+        rv = _strip(_DER, rv)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = _strip(_SUPERLATIVE, rv)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return start + rv
@@ -1,6 +1,56 @@
-from django.test import TestCase, Client
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.flatpages.models import FlatPage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection, connections, router
+from django.http import HttpResponse, QueryDict
+from django.test import (AsyncClient, Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.template import Context, Template, engines
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import User, Recipe, Tag, Product, Ingredient, Favorite, Purchase
+from .autocomplete import product_index
+from .management.commands.load_products import Command as LoadProducts
+from .card_cache import attach_fragments
+from .benchmarks import (VIEW_BENCHMARKS, benchmark_context, over_budget,
+                         run_benchmarks)
+from .cookable import CookableIndex, cookable_index
+from .forms import RecipeForm
+from .models import (AuthorStats, User, Recipe, Tag, Product, Ingredient,
+                     Favorite, Purchase, ShoppingListItem, cached_tags)
+from .search import (FallbackSearchBackend, SqliteSearchBackend,
+                     search_index)
+from .conditional import conditional_page
+from .page_cache import anonymous_page_cache, get_pages_version
+from .seed import seed
+from .thumbnails import (THUMBNAIL_OPTIONS, PregeneratingThumbnailBackend,
+                         pregenerate, resolve_thumbnails, thumbnail_pool)
+from .viewer import ViewerState
+from .views import RECIPES_PER_PAGE
+from PIL import Image as PILImage
+from foodgram.checks import check_shared_cache
+from foodgram.metrics import HISTOGRAMS, RequestMetrics, _current
+from foodgram.refdata import VERSION_KEY as REFDATA_VERSION_KEY
+from foodgram.refdata import RefData, RefDataMiddleware
+from foodgram.refdata import _registry as refdata_registry
+from foodgram.routers import (PIN_COOKIE, ReplicaPinMiddleware, primary,
+                              read_replica)
 from users.models import Subscription
 
 
@@ -121,6 +171,114 @@ class TestTagFilter(TestCase):
         # print(resp.status_code)
 
 
+class TestTagMask(TestCase):
+    """
+    Тесты маски тегов рецепта.
+
+    Проверяет, что маска обновляется при изменении тегов рецепта с обеих
+    сторон связи и при удалении тега, а фильтр по тегам использует ее.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='Test user',
+            email='test@test.test',
+            password='12345six')
+        self.breakfast = Tag.objects.create(name='завтрак', slug='breakfast')
+        self.lunch = Tag.objects.create(name='обед', slug='lunch')
+        self.recipe = _create_recipe(self.user, 'recipe', self.breakfast)
+
+    def _mask(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.tag_mask
+
+    def test_mask_maintenance(self):
+        self.assertEqual(self._mask(), self.breakfast.mask)
+        self.lunch.recipe_set.add(self.recipe)
+        self.assertEqual(self._mask(), self.breakfast.mask | self.lunch.mask)
+        self.recipe.tags.remove(self.breakfast)
+        self.assertEqual(self._mask(), self.lunch.mask)
+        self.lunch.delete()
+        self.assertEqual(self._mask(), 0)
+
+    def test_filter(self):
+        other = _create_recipe(self.user, 'other', self.lunch)
+        other.tags.add(self.breakfast)
+        self.assertEqual(
+            list(Recipe.recipes.tag_filter(['breakfast', 'lunch'])),
+            [other, self.recipe])
+        self.assertEqual(
+            list(Recipe.recipes.tag_filter(['lunch'])), [other])
+        self.assertEqual(
+            list(Recipe.recipes.tag_filter(['unknown'])), [])
+
+    def test_bit_race(self):
+        # Другой процесс успел занять выбранный бит: выбор повторяется
+        bits = [self.lunch.bit, Tag()._free_bit()]
+        with mock.patch.object(Tag, '_free_bit', side_effect=bits) as choose:
+            tag = Tag.objects.create(name='ужин', slug='dinner')
+        self.assertEqual(choose.call_count, 2)
+        self.assertNotEqual(tag.bit, self.lunch.bit)
+
+
+class TestKeysetPagination(TestCase):
+    """
+    Тесты пагинации по курсору.
+
+    Проверяет, что переход вперед и назад по курсорам возвращает
+    непересекающиеся страницы в порядке публикации и что некорректный
+    курсор, в том числе с числами за пределами полей базы, открывает
+    первую страницу.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='Test user',
+            email='test@test.test',
+            password='12345six')
+        tag = Tag.objects.create(name='обед', slug='lunch')
+        for i in range(15):
+            _create_recipe(self.user, f'recipe {i}', tag)
+        self.expected = list(
+            Recipe.recipes.order_by('-pub_date', '-id'))
+
+    def test_forward_and_back(self):
+        resp = self.client.get(reverse('index'))
+        page = resp.context['page']
+        seen = list(page)
+        self.assertFalse(page.has_previous())
+        while page.has_next():
+            resp = self.client.get(
+                reverse('index'), {'cursor': page.next_cursor})
+            page = resp.context['page']
+            seen.extend(page)
+        self.assertEqual(
+            seen, self.expected,
+            msg='Страницы должны идти подряд и не пересекаться')
+        self.assertEqual(page.number, 3)
+        self.assertEqual(page.paginator.num_pages, 3)
+        resp = self.client.get(
+            reverse('index'), {'cursor': page.previous_cursor})
+        self.assertEqual(
+            list(resp.context['page']), self.expected[6:12],
+            msg='Курсор назад должен вести на предыдущую страницу')
+
+    def test_bad_cursor(self):
+        resp = self.client.get(reverse('index'), {'cursor': 'garbage'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.context['page']), self.expected[:6])
+
+    def test_forged_cursor(self):
+        pub_date = self.expected[0].pub_date.isoformat()
+        for pk, number in ((10 ** 30, 2), (-10 ** 30, 2), (1, 10 ** 30)):
+            raw = json.dumps([pub_date, pk, number, 0]).encode()
+            cursor = base64.urlsafe_b64encode(raw).decode()
+            resp = self.client.get(reverse('index'), {'cursor': cursor})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.context['page'].number, 1)
+            self.assertEqual(list(resp.context['page']), self.expected[:6])
+
+
 class TestProfile(TestCase):
     """
     Тесты для страницы профиля.
@@ -255,6 +413,93 @@ class TestRecipePage(TestCase):
                  ' чужого рецепта'))
 
 
+class TestViewerState(TestCase):
+    """
+    Тесты состояния кнопок для текущего пользователя.
+
+    Проверяет, что избранное и покупки среди рецептов страницы загружаются
+    одним запросом и что кнопки на карточках отрисовываются по нему.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='Test user',
+            email='test@test.test',
+            password='12345six')
+        tag = Tag.objects.create(name='завтрак', slug='breakfast')
+        self.recipes = [
+            _create_recipe(self.user, f'recipe {i}', tag) for i in range(3)]
+        Favorite.favorite.add(self.user, self.recipes[0])
+        Favorite.favorite.add(self.user, self.recipes[1])
+        Purchase.purchase.add(self.user, self.recipes[1])
+        Purchase.purchase.add(self.user, self.recipes[2])
+
+    def test_load(self):
+        ids = [recipe.id for recipe in self.recipes[1:]]
+        with self.assertNumQueries(1):
+            state = ViewerState.load(self.user, ids)
+        self.assertEqual(state.favorites, frozenset(ids[:1]))
+        self.assertEqual(state.purchases, frozenset(ids))
+
+    def test_card_buttons(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('index'))
+        html = response.content.decode()
+        self.assertEqual(
+            html.count('icon-favorite_active'), 2,
+            msg='Избранные рецепты должны быть отмечены на карточках')
+        self.assertEqual(
+            html.count('Рецепт добавлен'), 2,
+            msg='Рецепты из списка покупок должны быть отмечены')
+
+
+class TestCardFragments(TestCase):
+    """
+    Тесты кэша фрагментов карточек рецептов.
+
+    Проверяет, что общая часть карточки отрисовывается один раз для всех
+    пользователей, кнопки остаются у каждого свои, а изменение рецепта
+    меняет ключ фрагмента.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test user')
+        self.other = User.objects.create(username='Other user')
+        tag = Tag.objects.create(name='завтрак', slug='breakfast')
+        self.recipes = [
+            _create_recipe(self.user, f'recipe {i}', tag) for i in range(2)]
+        Favorite.favorite.add(self.user, self.recipes[0])
+
+    def _index(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('index')).content.decode()
+
+    def test_shared_between_viewers(self):
+        with mock.patch('recipes.card_cache.render_to_string',
+                        wraps=render_to_string) as render:
+            html = self._index(self.user)
+            other_html = self._index(self.other)
+        self.assertEqual(render.call_count, 2,
+                         msg='Каждая карточка отрисовывается один раз')
+        self.assertEqual(html.count('icon-favorite_active'), 1)
+        self.assertEqual(other_html.count('icon-favorite_active'), 0)
+        self.assertEqual(html.count('class="card__title link"'), 2)
+
+    def test_recipe_change(self):
+        self._index(self.user)
+        recipe = self.recipes[1]
+        recipe.name = 'Новое название'
+        recipe.save()
+        self.assertIn('Новое название', self._index(self.other))
+
+    def test_cookable_not_cached(self):
+        card = Recipe.recipes.get(pk=self.recipes[0].pk)
+        card.covered, card.total, card.missing = 1, 2, ['соль']
+        attach_fragments([card])
+        self.assertFalse(hasattr(card, 'fragment'))
+
+
 class TestFavoritePage(TestCase):
     """
     Тесты страницы избранного.
@@ -274,9 +519,7 @@ class TestFavoritePage(TestCase):
         tag = Tag.objects.create(name='завтрак', slug='breakfast')
         self.recipe = _create_recipe(self.user, 'Favorite recipe', tag)
         _create_recipe(self.user, 'Unfavorite recipe', tag)
-        favorite = Favorite(user=self.user)
-        favorite.save()
-        favorite.recipes.add(Recipe.recipes.get(id=1))
+        Favorite.favorite.add(self.user, self.recipe)
 
     def test_not_auth_user(self):
         response = self.client.get(reverse('favorite'), follow=True)
@@ -343,6 +586,30 @@ class TestSubscriptionPage(TestCase):
             'Cool user', response.content.decode(),
             msg='На странице подписок должен быть добавленный автор')
 
+    def test_recipe_previews(self):
+        self.client.force_login(self.user2)
+        tag = self.recipe.tags.get()
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(reverse('my_subscriptions'))
+        for i in range(3):
+            author = User.objects.create(username=f'author{i}')
+            Subscription.objects.create(user=self.user2, author=author)
+            for j in range(5):
+                _create_recipe(author, f'Рецепт {i}-{j}', tag)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('my_subscriptions'))
+        self.assertEqual(
+            len(single), len(many),
+            msg='Число запросов не должно зависеть от числа рецептов')
+        cards = {
+            card.author.username: card for card in response.context['page']}
+        self.assertEqual(
+            [recipe.name for recipe in cards['author0'].previews],
+            ['Рецепт 0-4', 'Рецепт 0-3', 'Рецепт 0-2'])
+        self.assertEqual(cards['author0'].more_count, 2)
+        self.assertEqual(cards['Cool user'].more_count, 0)
+        self.assertContains(response, 'Еще 2 рецептов...', count=3)
+
 
 class TestPurchasePage(TestCase):
     """
@@ -362,9 +629,7 @@ class TestPurchasePage(TestCase):
             password='onetwo34')
         tag = Tag.objects.create(name='завтрак', slug='breakfast')
         self.recipe = _create_recipe(self.user, 'Cool recipe', tag)
-        purchase = Purchase(user=self.user)
-        purchase.save()
-        purchase.recipes.add(self.recipe)
+        Purchase.purchase.add(self.user, self.recipe)
 
     def test_not_auth_user(self):
         response = self.client.get(reverse('purchases'), follow=True)
@@ -384,6 +649,16 @@ class TestPurchasePage(TestCase):
             'Cool recipe', response.content.decode(),
             msg='На странице покупок должен быть добавленный рецепт')
 
+    def test_newest_first(self):
+        newer = _create_recipe(
+            self.user, 'Newer recipe', self.recipe.tags.first())
+        Purchase.purchase.add(self.user, newer)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('purchases'))
+        self.assertEqual(
+            list(response.context['recipes_list']), [newer, self.recipe],
+            msg='Последний добавленный рецепт должен быть первым')
+
 
 class TestIngredientQuery(TestCase):
     def setUp(self):
@@ -423,6 +698,46 @@ class TestIngredientQuery(TestCase):
                 msg=f'Имя ингредиента должно начинаеться на {query}')
 
 
+class TestIngredientIndex(TestCase):
+    """
+    Тесты индекса для автодополнения ингредиентов.
+
+    Проверяет, что поиск не зависит от регистра и буквы "ё", точное
+    совпадение и короткие названия идут первыми, количество результатов
+    ограничено, а индекс перестраивается при изменении продуктов.
+    """
+
+    def setUp(self):
+        product_index.invalidate()
+
+    def test_ranking(self):
+        Product.objects.create(title='Ёлочка лесная', unit='г')
+        Product.objects.create(title='елочка', unit='г')
+        data = product_index.search('ЕЛОЧКА')
+        self.assertEqual(
+            [d['title'] for d in data[:2]], ['елочка', 'Ёлочка лесная'],
+            msg='Точное совпадение должно быть первым, регистр и ё неважны')
+
+    def test_limit(self):
+        data = product_index.search('с', limit=5)
+        self.assertEqual(
+            len(data), 5, msg='Количество подсказок должно ограничиваться')
+
+    def test_rebuild(self):
+        self.assertEqual(product_index.search('тестовый продукт'), [])
+        product = Product.objects.create(title='тестовый продукт', unit='г')
+        self.assertEqual(
+            product_index.search('тестовый'),
+            [{'title': 'тестовый продукт', 'unit': 'г'}],
+            msg='Новый продукт должен появляться в подсказках')
+        product.delete()
+        self.assertEqual(
+            product_index.search('тестовый'), [],
+            msg='Удаленный продукт должен пропадать из подсказок')
+        with self.assertNumQueries(0):
+            product_index.search('чай')
+
+
 class TestFavoriteButton(TestCase):
     def setUp(self):
         self.client = Client()
@@ -463,8 +778,8 @@ class TestFavoriteButton(TestCase):
                       msg='Словарь должен содержать ключ "success"')
         self.assertEqual(data_incoming['success'], 'true',
                          msg='При добавлении в избранное success = true')
-        self.assertTrue(Favorite.favorite.get(
-            user=self.user).recipes.filter(id=self.recipe.id).exists(),
+        self.assertTrue(Favorite.favorite.filter(
+            user=self.user, recipe=self.recipe).exists(),
             msg='Должна создаваться соответствующая запись в бд')
         repeat_response = self.client.post(
             reverse('favorite'), data=self.data,
@@ -473,8 +788,8 @@ class TestFavoriteButton(TestCase):
         self.assertEqual(
             data_incoming_2['success'], 'false',
             msg='При попытке повторно добавить в избранное success = false')
-        self.assertEqual(Favorite.favorite.get(
-            user=self.user).recipes.filter(id=self.recipe.id).count(), 1,
+        self.assertEqual(Favorite.favorite.filter(
+            user=self.user, recipe=self.recipe).count(), 1,
             msg='Не должна создаваться повторная запись в бд')
 
     def test_auth_user_delete(self):
@@ -492,8 +807,8 @@ class TestFavoriteButton(TestCase):
                       msg='Словарь должен содержать ключ "success"')
         self.assertEqual(data_incoming['success'], 'true',
                          msg='При удалении из избранного success = true')
-        self.assertFalse(Favorite.favorite.get(
-            user=self.user).recipes.filter(id=self.recipe.id).exists(),
+        self.assertFalse(Favorite.favorite.filter(
+            user=self.user, recipe=self.recipe).exists(),
             msg='Должна удаляться соответствующая запись в бд')
         repeat_del_response = self.client.delete(
             reverse('delete_favorite', args=[self.recipe.id]),
@@ -627,8 +942,8 @@ class TestPurchaseButton(TestCase):
                       msg='Словарь должен содержать ключ "success"')
         self.assertEqual(data_incoming['success'], 'true',
                          msg='При добавлении в покупки значение ключа = true')
-        self.assertTrue(Purchase.purchase.get(
-            user=self.user).recipes.filter(id=self.recipe.id).exists(),
+        self.assertTrue(Purchase.purchase.filter(
+            user=self.user, recipe=self.recipe).exists(),
             msg='Должна создаваться соответствующая запись в бд')
         repeat_response = self.client.post(
             reverse('purchases'), data=self.data,
@@ -638,8 +953,8 @@ class TestPurchaseButton(TestCase):
             data_incoming_2['success'], 'false',
             msg='При попытке повторно добавить в покупки success = false')
         self.assertEqual(
-            Purchase.purchase.get(user=self.user)
-            .recipes.filter(id=self.recipe.id).count(), 1,
+            Purchase.purchase.filter(
+                user=self.user, recipe=self.recipe).count(), 1,
             msg='Не должна создаваться повторная запись в бд')
 
     def test_auth_user_delete(self):
@@ -657,8 +972,8 @@ class TestPurchaseButton(TestCase):
         self.assertEqual(data_incoming['success'], 'true',
                          msg='При удалении из покупок значение ключа = true')
         self.assertFalse(
-            Purchase.purchase.get(user=self.user)
-            .recipes.filter(id=self.recipe.id).exists(),
+            Purchase.purchase.filter(
+                user=self.user, recipe=self.recipe).exists(),
             msg='Должна удаляться соответствующая запись в бд')
         repeat_del_response = self.client.delete(
             reverse('delete_purchase', args=[self.recipe.id]),
@@ -667,3 +982,1320 @@ class TestPurchaseButton(TestCase):
         self.assertEqual(
             data_incoming_2['success'], 'false',
             msg='При попытке повторно удалить из покупок success = false')
+
+
+class TestPurchaseCounter(TestCase):
+    """
+    Тесты денормализованного счетчика списка покупок.
+
+    Проверяет, что счетчик меняется при добавлении и удалении рецептов
+    через API, при удалении строк (как в админке) и рецепта, а команда
+    reconcile_counters исправляет расхождения.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='Another test user',
+            email='another@test.test',
+            password='onetwo34')
+        tag = Tag.objects.create(name='завтрак', slug='breakfast')
+        self.recipes = [
+            _create_recipe(self.user, f'recipe {i}', tag) for i in range(3)]
+        self.client.force_login(self.user)
+
+    def test_api(self):
+        for recipe in self.recipes:
+            self.client.post(
+                reverse('purchases'), data={'id': recipe.id},
+                content_type='application/json')
+        self.assertEqual(Purchase.purchase.counter(self.user), 3)
+        self.client.delete(reverse('delete_purchase', args=[
+            self.recipes[0].id]))
+        self.assertEqual(Purchase.purchase.counter(self.user), 2)
+        response = self.client.get(reverse('index'))
+        self.assertIn('id="counter">2<', response.content.decode())
+
+    def test_admin_and_delete(self):
+        Purchase.purchase.create(user=self.user, recipe=self.recipes[0])
+        Purchase.purchase.create(user=self.user, recipe=self.recipes[1])
+        self.assertEqual(Purchase.purchase.counter(self.user), 2)
+        self.recipes[0].purchase_set.all().delete()
+        self.assertEqual(Purchase.purchase.counter(self.user), 1)
+        self.recipes[1].delete()
+        self.assertEqual(Purchase.purchase.counter(self.user), 0)
+
+    def test_reconcile(self):
+        for recipe in self.recipes:
+            Purchase.purchase.add(self.user, recipe)
+        AuthorStats.objects.update(purchases_count=10)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(Purchase.purchase.counter(self.user), 3)
+
+
+class TestCounters(TestCase):
+    """
+    Тесты счетчиков рецептов и авторов.
+
+    Проверяет, что счетчики избранного, покупок, рецептов и подписок
+    меняются вместе с исходными таблицами, в том числе при каскадном
+    удалении, строку избранного или покупок нельзя перенести в админке, а
+    reconcile_counters исправляет расхождения.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        tag = Tag.objects.create(name='завтрак', slug='breakfast')
+        self.recipes = [
+            _create_recipe(self.author, f'recipe {i}', tag) for i in range(3)]
+
+    def _recipe_counts(self, field):
+        return list(Recipe.recipes.order_by('pk').filter(
+            pk__in=[r.pk for r in self.recipes]
+        ).values_list(field, flat=True))
+
+    def _stats(self, user):
+        stats = AuthorStats.objects.get(user=user)
+        return (stats.recipes_count, stats.followers_count,
+                stats.following_count)
+
+    def test_recipe_counters(self):
+        for recipe in self.recipes[:2]:
+            Favorite.favorite.add(self.reader, recipe)
+        self.assertFalse(Favorite.favorite.add(self.reader, self.recipes[0]))
+        Favorite.favorite.add(self.author, self.recipes[2])
+        self.assertEqual(self._recipe_counts('favorites_count'), [1, 1, 1])
+        # Удаление несвязанного рецепта не уменьшает счетчик
+        Favorite.favorite.remove(self.reader, self.recipes[0])
+        self.assertFalse(Favorite.favorite.remove(
+            self.reader, self.recipes[2]))
+        self.assertEqual(self._recipe_counts('favorites_count'), [0, 1, 1])
+        self.recipes[2].favorite_set.all().delete()
+        Favorite.favorite.filter(user=self.reader).delete()
+        self.assertEqual(self._recipe_counts('favorites_count'), [0, 0, 0])
+
+        self.client.force_login(self.reader)
+        self.client.post(reverse('purchases'), {'id': self.recipes[1].pk},
+                         content_type='application/json')
+        self.assertEqual(self._recipe_counts('purchases_count'), [0, 1, 0])
+        self.reader.delete()
+        self.assertEqual(self._recipe_counts('purchases_count'), [0, 0, 0])
+
+    def test_author_counters(self):
+        self.assertEqual(self._stats(self.author), (3, 0, 0))
+        self.client.force_login(self.reader)
+        self.client.post(reverse('subscription'), {'id': self.author.pk},
+                         content_type='application/json')
+        self.assertEqual(self._stats(self.author), (3, 1, 0))
+        self.assertEqual(self._stats(self.reader), (0, 0, 1))
+        self.recipes[0].delete()
+        self.client.delete(
+            reverse('delete_subscription', args=[self.author.pk]))
+        self.assertEqual(self._stats(self.author), (2, 0, 0))
+        self.assertEqual(self._stats(self.reader), (0, 0, 0))
+
+        operations = [{'collection': 'subscriptions', 'action': 'add',
+                       'id': self.author.pk}]
+        for _ in range(2):
+            self.client.post(reverse('toggles'), {'operations': operations},
+                             content_type='application/json')
+        self.assertEqual(self._stats(self.author), (2, 1, 0))
+        self.assertEqual(self._stats(self.reader), (0, 0, 1))
+
+        response = self.client.get(reverse('profile', args=[self.author.pk]))
+        self.assertContains(response, 'Рецептов: 2 · Подписчиков: 1')
+
+    def test_admin_cannot_move_row(self):
+        purchase = Purchase.purchase.create(
+            user=self.reader, recipe=self.recipes[0])
+        admin = User.objects.create(
+            username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        url = reverse('admin:recipes_purchase_change', args=[purchase.pk])
+        self.assertNotContains(self.client.get(url), 'name="user"')
+        self.client.post(url, {'user': self.author.pk,
+                               'recipe': self.recipes[1].pk})
+        purchase.refresh_from_db()
+        self.assertEqual(
+            (purchase.user, purchase.recipe), (self.reader, self.recipes[0]))
+        self.assertEqual(self._recipe_counts('purchases_count'), [1, 0, 0])
+
+    def test_reconcile(self):
+        Favorite.favorite.add(self.reader, self.recipes[0])
+        Subscription.objects.create(user=self.reader, author=self.author)
+        Recipe.recipes.update(favorites_count=5, purchases_count=5)
+        AuthorStats.objects.filter(user=self.reader).delete()
+        AuthorStats.objects.update(followers_count=7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self._recipe_counts('favorites_count'), [1, 0, 0])
+        self.assertEqual(self._recipe_counts('purchases_count'), [0, 0, 0])
+        self.assertEqual(self._stats(self.author), (3, 1, 0))
+        self.assertEqual(self._stats(self.reader), (0, 0, 1))
+
+
+class TestAnonymousPageCache(TestCase):
+    """
+    Тесты кэша страниц для неавторизованных пользователей.
+
+    Проверяет, что повторный запрос с тем же набором тегов не обращается к
+    базе, а изменение рецепта сбрасывает кэш.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username='Test user',
+            email='test@test.test',
+            password='12345six')
+        self.tag = Tag.objects.create(name='обед', slug='lunch')
+        self.recipe = _create_recipe(self.user, 'Old name', self.tag)
+
+    def test_cache_hit(self):
+        self.client.get(f'{reverse("index")}?tag=lunch&tag=dinner')
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                f'{reverse("index")}?tag=dinner&tag=lunch&tag=lunch')
+        self.assertIn('Old name', response.content.decode())
+
+    def test_invalidation(self):
+        url = reverse('recipe', args=[self.recipe.id])
+        self.client.get(url)
+        self.recipe.name = 'New name'
+        self.recipe.save()
+        response = self.client.get(url)
+        self.assertIn(
+            'New name', response.content.decode(),
+            msg='Изменение рецепта должно сбрасывать кэш страниц')
+
+    def test_version_does_not_expire(self):
+        version = get_pages_version()
+        with mock.patch('time.time', return_value=time.time() + 60 * 60):
+            self.assertEqual(get_pages_version(), version)
+
+    def test_auth_user_not_cached(self):
+        self.client.get(reverse('index'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('index'))
+        self.assertIn(
+            'id="counter"', response.content.decode(),
+            msg='Авторизованный юзер не должен получать страницу из кэша')
+
+
+class TestRefData(TestCase):
+    """
+    Тесты справочников в памяти процесса (теги, продукты, flatpages).
+
+    Проверяет, что справочник читается из базы один раз, изменение
+    в любом процессе (сдвиг версии в общем кэше) видно на следующем запросе,
+    версия не истекает, а кэш в памяти процесса дает предупреждение.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.tag = Tag.objects.create(name='полдник', slug='snack')
+        self.factory = RequestFactory()
+
+    def test_no_queries_when_warm(self):
+        Tag.objects.cached()
+        with self.assertNumQueries(0):
+            tags = Tag.objects.cached()
+            mask = Tag.objects.get_mask(['snack'])
+            RecipeForm().as_p()
+        self.assertIn(self.tag, tags)
+        self.assertEqual(mask, self.tag.mask)
+
+    def test_shared_cache_used_by_other_process(self):
+        Tag.objects.cached()
+        # Новый процесс: пустой L1, но данные уже в общем кэше
+        cached_tags._state = (None, None)
+        with self.assertNumQueries(0):
+            self.assertIn(self.tag, Tag.objects.cached())
+
+    def test_change_is_visible(self):
+        Tag.objects.cached()
+        tag = Tag.objects.create(name='ужин', slug='dinner')
+        self.assertIn(tag, Tag.objects.cached())
+        tag.delete()
+        self.assertNotIn(tag, Tag.objects.cached())
+
+    def test_version_read_once_per_request(self):
+        def view(request):
+            first = Tag.objects.cached()
+            # Другой процесс меняет теги посреди запроса
+            cache.incr(REFDATA_VERSION_KEY.format('tags'))
+            with self.assertNumQueries(0):
+                self.assertIs(Tag.objects.cached(), first)
+            return HttpResponse()
+
+        RefDataMiddleware(view)(self.factory.get('/'))
+        with self.assertNumQueries(1):
+            Tag.objects.cached()
+
+    def test_flatpage(self):
+        page = FlatPage.objects.create(
+            url='/about-author/', title='Об авторе', content='Первая версия')
+        page.sites.add(settings.SITE_ID)
+        url = reverse('about-author')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Первая версия')
+        page.content = 'Вторая версия'
+        page.save()
+        self.assertContains(self.client.get(url), 'Вторая версия')
+        self.assertEqual(self.client.get('/about/missing/').status_code, 404)
+
+    def test_version_does_not_expire(self):
+        Tag.objects.cached()
+        with mock.patch('time.time', return_value=time.time() + 60 * 60):
+            with self.assertNumQueries(0):
+                Tag.objects.cached()
+
+    def test_local_cache_warning(self):
+        self.assertEqual(
+            [warning.id for warning in check_shared_cache(None)],
+            ['foodgram.W001'])
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.gettempdir()}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class TestShoppingList(TestCase):
+    """
+    Тесты сводного списка покупок.
+
+    Проверяет, что список обновляется при добавлении и удалении рецептов из
+    покупок и при изменении ингредиентов купленного рецепта, а скачиваемый
+    файл строится по нему.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='Another test user',
+            email='another@test.test',
+            password='onetwo34')
+        tag = Tag.objects.create(name='завтрак', slug='breakfast')
+        self.recipe1 = _create_recipe(self.user, 'recipe 1', tag)
+        self.recipe2 = _create_recipe(self.user, 'recipe 2', tag)
+
+    def _items(self):
+        # _create_recipe создает новые продукты с теми же названиями
+        items = {}
+        for title, amount in ShoppingListItem.objects.filter(
+                user=self.user).values_list('product__title', 'amount'):
+            items[title] = items.get(title, 0) + amount
+        return items
+
+    def test_incremental_updates(self):
+        Purchase.purchase.add(self.user, self.recipe1)
+        Purchase.purchase.add(self.user, self.recipe2)
+        self.assertEqual(self._items(), {'testIng0': 4, 'testIng1': 4})
+        ingredient = self.recipe1.ingredient_set.get(
+            ingredient__title='testIng0')
+        ingredient.amount = 5
+        ingredient.save()
+        self.assertEqual(self._items(), {'testIng0': 7, 'testIng1': 4})
+        ingredient.delete()
+        self.assertEqual(self._items(), {'testIng0': 2, 'testIng1': 4})
+        Purchase.purchase.remove(self.user, self.recipe2)
+        self.assertEqual(self._items(), {'testIng1': 2})
+        self.recipe1.delete()
+        self.assertEqual(self._items(), {})
+
+    def test_download(self):
+        Purchase.purchase.add(self.user, self.recipe1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('shop-list'))
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(
+            content,
+            '  Продукт (единицы) - количество \n \n'
+            '+ testIng0 (0) - 2.0\n+ testIng1 (1) - 2.0')
+
+
+class TestRecipeIngredients(TestCase):
+    """
+    Тесты сохранения ингредиентов рецепта.
+
+    Проверяет, что форма находит продукты одним запросом и сообщает о
+    неизвестных, а при редактировании меняются только отличающиеся строки.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='Test user',
+            email='test@test.test',
+            password='12345six')
+        tag = Tag.objects.create(name='завтрак', slug='breakfast')
+        self.recipe = _create_recipe(self.user, 'recipe', tag)
+
+    def _form(self, ingredients):
+        data = QueryDict(mutable=True)
+        data.update({'name': 'recipe', 'cook_time': 5,
+                     'description': 'test'})
+        for title, unit, amount in ingredients:
+            data.appendlist('nameIngredient', title)
+            data.appendlist('unitsIngredient', unit)
+            data.appendlist('valueIngredient', amount)
+        return RecipeForm(data, instance=self.recipe)
+
+    def test_unknown_product(self):
+        form = self._form([('чай черный', 'г', '2'), ('нет такого', 'г', '1')])
+        with self.assertNumQueries(1):
+            form.full_clean()
+        self.assertIn(
+            'Неизвестный продукт: нет такого (г)', form.non_field_errors(),
+            msg='Форма должна сообщать о неизвестных продуктах')
+
+    def test_diff_update(self):
+        kept = self.recipe.ingredient_set.order_by('pk').first()
+        form = self._form([
+            ('testIng0', '0', '2'),
+            ('чай черный', 'г', '3'),
+            ('чай черный', 'г', '1'),
+        ])
+        form.full_clean()
+        Ingredient.objects.sync(self.recipe, form.cleaned_data['ingredients'])
+        rows = {i.ingredient.title: i
+                for i in self.recipe.ingredient_set.all()}
+        self.assertEqual(set(rows), {'testIng0', 'чай черный'})
+        self.assertEqual(
+            rows['testIng0'].pk, kept.pk,
+            msg='Неизмененный ингредиент не должен пересоздаваться')
+        self.assertEqual(rows['чай черный'].amount, 4)
+        form = self._form([('testIng0', '0', '5')])
+        form.full_clean()
+        Ingredient.objects.sync(self.recipe, form.cleaned_data['ingredients'])
+        kept.refresh_from_db()
+        self.assertEqual(kept.amount, 5)
+        self.assertEqual(self.recipe.ingredient_set.count(), 1)
+
+
+class _InlineExecutor:
+    # Пул процессов не видит тестовую базу: задачи выполняются на месте
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, *iterables, chunksize=1):
+        return map(fn, *iterables)
+
+
+class TestThumbnails(TestCase):
+    """
+    Тесты фонового создания миниатюр.
+
+    Проверяет, что бэкенд не создает миниатюру в запросе, а ставит ее в
+    очередь и отдает исходное изображение, что такие карточки и страницы
+    не кэшируются, что в очередь попадает только новое изображение рецепта,
+    и что после фоновой задачи или generate_thumbnails шаблон получает
+    готовую миниатюру.
+    """
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        buffer = BytesIO()
+        PILImage.new('RGB', (600, 400), 'red').save(buffer, 'JPEG')
+        self.name = default_storage.save(
+            'recipes/test.jpg', ContentFile(buffer.getvalue()))
+
+    def test_placeholder_without_generation(self):
+        backend = PregeneratingThumbnailBackend()
+        with mock.patch.object(thumbnail_pool, 'submit') as submit:
+            image = backend.get_thumbnail(
+                self.name, '364x240', **THUMBNAIL_OPTIONS)
+        submit.assert_called_once_with(self.name)
+        self.assertEqual(image.name, self.name)
+        # Размер оригинала не подменяется размером миниатюры
+        self.assertIsNone(image.size)
+        self.assertEqual(os.listdir(self.media), ['recipes'])
+
+    def test_pregenerated_thumbnail(self):
+        pregenerate(self.name)
+        backend = PregeneratingThumbnailBackend()
+        with mock.patch.object(thumbnail_pool, 'submit') as submit:
+            image = backend.get_thumbnail(
+                self.name, '364x240', **THUMBNAIL_OPTIONS)
+        submit.assert_not_called()
+        self.assertNotEqual(image.name, self.name)
+        self.assertTrue(default_storage.exists(image.name))
+        self.assertEqual((image.width, image.height), (364, 240))
+
+    def test_deterministic_name(self):
+        backend = PregeneratingThumbnailBackend()
+        name = backend.thumbnail_name(
+            self.name, '364x240', **THUMBNAIL_OPTIONS)
+        self.assertRegex(name, r'^cache/recipes/test_364x240_\w{8}\.jpg$')
+        self.assertNotEqual(
+            name, backend.thumbnail_name(self.name, '90x90',
+                                         **THUMBNAIL_OPTIONS))
+        pregenerate(self.name)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_resolve_page_in_one_lookup(self):
+        pregenerate(self.name)
+        cache.clear()
+        user = User.objects.create(username='Test user')
+        tag = Tag.objects.create(name='обед', slug='lunch')
+        for i in range(3):
+            recipe = _create_recipe(user, f'Recipe {i}', tag)
+            recipe.image = self.name
+            recipe.save()
+        images = [recipe.image for recipe in Recipe.recipes.all()]
+        with self.assertNumQueries(1):
+            resolve_thumbnails(images, '364x240')
+        backend = PregeneratingThumbnailBackend()
+        with self.assertNumQueries(0), mock.patch.object(
+                thumbnail_pool, 'submit') as submit:
+            thumbnails = [
+                backend.get_thumbnail(image, '364x240', **THUMBNAIL_OPTIONS)
+                for image in images]
+        submit.assert_not_called()
+        self.assertEqual(len({thumbnail.name for thumbnail in thumbnails}), 1)
+        self.assertEqual((thumbnails[0].width, thumbnails[0].height),
+                         (364, 240))
+
+    def _upload_recipe(self):
+        user = User.objects.create(username='Test user')
+        recipe = _create_recipe(
+            user, 'Суп', Tag.objects.create(name='обед', slug='lunch'))
+        with open(os.path.join(self.media, self.name), 'rb') as file_:
+            recipe.image = SimpleUploadedFile(
+                'soup.jpg', file_.read(), content_type='image/jpeg')
+        recipe.save()
+        return recipe
+
+    def test_placeholder_on_upload(self):
+        recipe = self._upload_recipe()
+        self.assertTrue(
+            recipe.image_placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(recipe.image_placeholder), 600)
+        recipe.image = ''
+        recipe.save()
+        self.assertEqual(recipe.image_placeholder, '')
+
+    def _saved_images(self, save):
+        # TestCase не фиксирует транзакцию, поэтому колбэки вызываются вручную
+        with override_settings(THUMBNAIL_WORKERS=1), mock.patch.object(
+                thumbnail_pool, 'submit') as submit:
+            result = save()
+            callbacks = [func for _, func in connection.run_on_commit]
+            connection.run_on_commit = []
+            for func in callbacks:
+                func()
+        return result, [call.args[0] for call in submit.call_args_list]
+
+    def test_pregenerate_on_upload(self):
+        recipe, submitted = self._saved_images(self._upload_recipe)
+        self.assertEqual(submitted, [recipe.image.name])
+        recipe.name = 'Борщ'
+        _, submitted = self._saved_images(recipe.save)
+        self.assertEqual(submitted, [])
+        _, submitted = self._saved_images(
+            Recipe.recipes.get(pk=recipe.pk).save)
+        self.assertEqual(submitted, [])
+
+    def test_picture_tag(self):
+        recipe = self._upload_recipe()
+        pregenerate(recipe.image.name)
+        html = Template(
+            '{% load user_filters %}'
+            '{% picture recipe "364x240" css="card__image" %}'
+        ).render(Context({'recipe': recipe}))
+        self.assertIn('<source type="image/webp" srcset="', html)
+        self.assertRegex(html, r'_364x240_\w{8}\.webp 1x, \S+_728x480_')
+        self.assertRegex(html, r'src="/media/cache/recipes/soup\w*_364x240')
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('url(data:image/jpeg;base64,', html)
+
+    def test_picture_before_generation(self):
+        recipe = self._upload_recipe()
+        with mock.patch.object(thumbnail_pool, 'submit'):
+            html = Template(
+                '{% load user_filters %}{% picture recipe "480x480" %}'
+            ).render(Context({'recipe': recipe}))
+        self.assertNotIn('<source', html)
+        self.assertIn(f'src="{recipe.image.url}"', html)
+        self.assertIn('width="480" height="480"', html)
+        self.assertIn('object-fit: cover', html)
+
+    def test_card_while_pending(self):
+        recipe = self._upload_recipe()
+        with mock.patch.object(thumbnail_pool, 'submit'), mock.patch(
+                'recipes.card_cache.render_to_string',
+                wraps=render_to_string) as render:
+            for _ in range(2):
+                card = attach_fragments([Recipe.recipes.get(pk=recipe.pk)])[0]
+        # Фрагмент с исходным изображением не попадает в кэш
+        self.assertEqual(render.call_count, 2)
+        self.assertIn(f'src="{recipe.image.url}"', card.fragment)
+        pregenerate(recipe.image.name)
+        card = attach_fragments([Recipe.recipes.get(pk=recipe.pk)])[0]
+        self.assertRegex(card.fragment, r'src="/media/cache/recipes/soup')
+
+    def test_page_while_pending(self):
+        recipe = self._upload_recipe()
+        url = reverse('recipe', args=[recipe.pk])
+        with mock.patch.object(thumbnail_pool, 'submit') as submit:
+            self.client.get(url)
+            first = submit.call_count
+            response = self.client.get(url)
+        # Страница с исходным изображением строится заново
+        self.assertGreater(first, 0)
+        self.assertEqual(submit.call_count, 2 * first)
+        self.assertContains(response, f'src="{recipe.image.url}"')
+        pregenerate(recipe.image.name)
+        self.assertContains(self.client.get(url), '<source type="image/webp"')
+
+    def test_generate_thumbnails(self):
+        recipe = self._upload_recipe()
+        Recipe.recipes.filter(pk=recipe.pk).update(image_placeholder='')
+        version = get_pages_version()
+        with mock.patch(
+                'recipes.management.commands.generate_thumbnails.'
+                'ProcessPoolExecutor', _InlineExecutor):
+            call_command('generate_thumbnails', stdout=StringIO())
+        updated = Recipe.recipes.get(pk=recipe.pk)
+        self.assertTrue(updated.image_placeholder)
+        self.assertGreater(updated.modified, recipe.modified)
+        self.assertGreater(get_pages_version(), version)
+
+
+class TestLoadProducts(TestCase):
+    """
+    Тесты команды загрузки каталога продуктов.
+
+    Проверяет, что недостающие продукты добавляются, уже существующие не
+    дублируются, некорректные строки пропускаются, повторный запуск
+    ничего не меняет, а загрузка через COPY считает строки так же.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        Product.objects.create(title='елочка', unit='г')
+
+    def _load(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as catalog:
+            catalog.write(content)
+        out = StringIO()
+        call_command('load_products', path, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_csv(self):
+        content = 'елочка,г\nелочка,шт\n  палочка , кг\nбез единиц\n'
+        before = Product.objects.count()
+        self.assertIn(
+            'Добавлено: 2, уже есть: 1, пропущено: 1',
+            self._load('catalog.csv', content))
+        self.assertEqual(Product.objects.count(), before + 2)
+        self.assertTrue(
+            Product.objects.filter(title='палочка', unit='кг').exists())
+        self.assertIn(
+            'Добавлено: 0, уже есть: 3, пропущено: 1',
+            self._load('catalog.csv', content))
+        self.assertEqual(Product.objects.count(), before + 2)
+
+    def test_ndjson(self):
+        content = ('{"title": "елочка", "unit": "г"}\n'
+                   '{"title": "палочка", "unit": "кг"}\n'
+                   '{"title": "палочка"}\n')
+        self.assertIn(
+            'Добавлено: 1, уже есть: 1, пропущено: 1',
+            self._load('catalog.ndjson', content))
+        self.assertEqual(
+            product_index.search('палочка'),
+            [{'title': 'палочка', 'unit': 'кг'}])
+
+    def test_duplicates(self):
+        content = 'елочка,шт\nелочка,шт\nелочка,г\n'
+        self.assertIn(
+            'Добавлено: 1, уже есть: 2, пропущено: 0',
+            self._load('catalog.csv', content))
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'COPY есть только в PostgreSQL')
+    def test_copy(self):
+        content = 'елочка,г\nелочка,шт\nелочка,шт\n  палочка , кг\n'
+        with mock.patch.object(LoadProducts, '_insert_missing',
+                               side_effect=AssertionError):
+            self.assertIn(
+                'Добавлено: 2, уже есть: 2, пропущено: 0',
+                self._load('catalog.csv', content))
+            self.assertIn(
+                'Добавлено: 0, уже есть: 4, пропущено: 0',
+                self._load('catalog.csv', content))
+        self.assertTrue(
+            Product.objects.filter(title='палочка', unit='кг').exists())
+
+
+class TestViewQueryBudgets(TestCase):
+    """
+    Тесты бюджета SQL-запросов основных страниц.
+
+    На наборе данных из seed_data проверяет, что каждая страница отвечает
+    успешно и укладывается в объявленный бюджет запросов, в том числе
+    когда тегов больше трех.
+    """
+    def setUp(self):
+        seed(users=6, recipes=40, ingredients=5, products=50, favorites=8,
+             purchases=3, subscriptions=3)
+
+    def test_budgets(self):
+        results = run_benchmarks(benchmark_context(), repeat=1)
+        for result in results:
+            self.assertEqual(result.status, 200, msg=result.name)
+            self.assertGreater(result.sql_ms, 0, msg=result.name)
+        self.assertEqual(
+            [(result.name, result.queries) for result in over_budget(results)],
+            [], msg='Страницы превысили бюджет запросов')
+
+    def test_more_tags(self):
+        User.objects.filter(username__startswith='seed-').delete()
+        seed(users=2, recipes=5, ingredients=2, tags=5, products=10,
+             favorites=1, purchases=1, subscriptions=1)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'badge badge_style_green">tag4')
+        self.assertEqual(run_benchmarks(
+            benchmark_context(), repeat=1,
+            benchmarks=VIEW_BENCHMARKS[:1])[0].status, 200)
+
+    def test_seed_is_deterministic(self):
+        first = list(Recipe.recipes.filter(
+            author__username__startswith='seed-'
+        ).order_by('pk').values_list('author__username', 'tag_mask'))
+        User.objects.filter(username__startswith='seed-').delete()
+        seed(users=6, recipes=40, ingredients=5, products=50, favorites=8,
+             purchases=3, subscriptions=3)
+        second = list(Recipe.recipes.filter(
+            author__username__startswith='seed-'
+        ).order_by('pk').values_list('author__username', 'tag_mask'))
+        self.assertEqual(first, second)
+
+
+class TestMetrics(TestCase):
+    """
+    Тесты метрик запросов.
+
+    Проверяет заголовок Server-Timing, что вложенная отрисовка шаблона не
+    учитывается дважды и что страница метрик доступна только
+    администратору или по токену и содержит гистограммы по имени
+    представления.
+    """
+    def setUp(self):
+        cache.clear()
+        for histogram in HISTOGRAMS:
+            histogram.reset()
+        self.client = Client()
+        self.admin = User.objects.create(username='admin', is_staff=True)
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('index'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+, total;dur=[\d.]+')
+
+    def test_nested_template(self):
+        # Часы сдвигаются на секунду при каждом чтении
+        clock = iter(range(100))
+        engine = engines.all()[0]
+        inner = engine.from_string('{{ name }}')
+        outer = engine.from_string('<{{ inner }}>')
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with mock.patch('foodgram.metrics.time.perf_counter',
+                            lambda: next(clock)):
+                html = outer.render(
+                    {'inner': lambda: inner.render({'name': 'карточка'})})
+        finally:
+            _current.reset(token)
+        self.assertEqual(html, '<карточка>')
+        self.assertEqual(metrics.template_time, 1)
+
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_histograms(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.client.force_login(self.admin)
+        content = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn(
+            'foodgram_request_duration_seconds_count{view="index"} 2',
+            content)
+        self.assertIn(
+            'foodgram_db_queries_bucket{view="index",le="+Inf"} 2', content)
+        self.assertIn(
+            'foodgram_template_duration_seconds_sum{view="index"}', content)
+
+
+class TestToggleApi(TestCase):
+    """
+    Тесты пакетного API избранного, покупок и подписок.
+
+    Проверяет, что операции применяются одним запросом, повторные
+    операции не создают дубликатов, из нескольких операций над одним
+    рецептом действует последняя, подписка обновляет страницу автора в
+    кэше, а некорректный запрос отклоняется.
+    """
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create(username='user')
+        self.author = User.objects.create(username='author')
+        tag = Tag.objects.create(name='завтрак', slug='breakfast')
+        self.recipe = _create_recipe(self.author, 'Рецепт 1', tag)
+        self.other = _create_recipe(self.author, 'Рецепт 2', tag)
+        self.client.force_login(self.user)
+
+    def _toggle(self, *operations):
+        return self.client.post(
+            reverse('toggles'), content_type='application/json',
+            data={'operations': [
+                {'collection': collection, 'action': action, 'id': pk}
+                for collection, action, pk in operations]})
+
+    def test_batch(self):
+        operations = (
+            ('favorites', 'add', self.recipe.id),
+            ('purchases', 'add', self.recipe.id),
+            ('purchases', 'add', self.other.id),
+            ('subscriptions', 'add', self.author.id),
+        )
+        for _ in range(2):
+            data = self._toggle(*operations).json()
+        self.assertEqual(data['success'], 'true')
+        self.assertEqual(data['favorites'], {str(self.recipe.id): True})
+        self.assertEqual(data['subscriptions'], {str(self.author.id): True})
+        self.assertEqual(data['purchase_counter'], 2)
+        self.assertEqual(Favorite.favorite.filter(user=self.user).count(), 1)
+        self.assertEqual(Purchase.purchase.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            Subscription.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            ShoppingListItem.objects.filter(user=self.user).count(), 4)
+
+    def test_last_operation_wins(self):
+        data = self._toggle(
+            ('favorites', 'add', self.recipe.id),
+            ('favorites', 'remove', self.recipe.id),
+            ('subscriptions', 'add', self.user.id),
+        ).json()
+        self.assertEqual(data['favorites'], {str(self.recipe.id): False})
+        self.assertEqual(data['subscriptions'], {str(self.user.id): False})
+        self.assertFalse(Favorite.favorite.filter(user=self.user).exists())
+
+    def test_subscription_resets_profile(self):
+        url = reverse('profile', args=[self.author.pk])
+        anonymous = Client()
+        self.assertContains(anonymous.get(url), 'Подписчиков: 0')
+        self._toggle(('subscriptions', 'add', self.author.id))
+        self.assertContains(anonymous.get(url), 'Подписчиков: 1')
+        self._toggle(('subscriptions', 'remove', self.author.id))
+        self.assertContains(anonymous.get(url), 'Подписчиков: 0')
+
+    def test_remove(self):
+        self._toggle(('purchases', 'add', self.recipe.id))
+        data = self._toggle(('purchases', 'remove', self.recipe.id)).json()
+        self.assertEqual(data['purchases'], {str(self.recipe.id): False})
+        self.assertEqual(data['purchase_counter'], 0)
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.user).exists())
+
+    def test_invalid(self):
+        for body in ({}, {'operations': []},
+                     {'operations': [{'collection': 'x', 'action': 'add',
+                                      'id': 1}]},
+                     {'operations': [{'collection': 'favorites',
+                                      'action': 'add', 'id': 'x'}]}):
+            response = self.client.post(
+                reverse('toggles'), data=body,
+                content_type='application/json')
+            self.assertEqual(response.status_code, 400, msg=body)
+
+
+class TestSearch(TestCase):
+    """
+    Тесты полнотекстового поиска рецептов.
+
+    Проверяет поиск по названию, описанию и ингредиентам с учетом
+    словоформ и префиксов, порядок по релевантности, обновление индекса
+    и числа найденных при изменении рецепта и страницу поиска.
+    """
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create(username='author')
+        self.fried = self._recipe(
+            'Жареная картошка', 'Обжарить до золотистой корочки')
+        self.soup = self._recipe(
+            'Суп', 'Сварить бульон, добавить картошку и морковь',
+            ingredient='морковь молодая')
+
+    def _recipe(self, name, description, ingredient=None):
+        recipe = Recipe.recipes.create(
+            author=self.author, name=name, description=description,
+            cook_time=10)
+        if ingredient:
+            product = Product.objects.create(title=ingredient, unit='г')
+            Ingredient.objects.create(
+                recipe=recipe, ingredient=product, amount=1)
+        return recipe
+
+    def _search(self, query):
+        return search_index.search(query).fetch(0, 10)
+
+    def test_sqlite_index(self):
+        self.assertIsInstance(search_index.backend, SqliteSearchBackend)
+
+    def test_word_forms_and_prefix(self):
+        self.assertEqual(self._search('картошки'), [self.fried, self.soup])
+        self.assertEqual(self._search('КАРТО'), [self.fried, self.soup])
+        self.assertEqual(self._search('жареный картофель'), [])
+        self.assertEqual(self._search('молодой'), [self.soup])
+        self.assertEqual(self._search(''), [])
+        self.assertEqual(search_index.search('картошка').count(), 2)
+
+    def test_index_updates(self):
+        self.soup.name = 'Борщ'
+        self.soup.save()
+        self.assertEqual(self._search('борща'), [self.soup])
+        Ingredient.objects.sync(self.soup, {
+            Product.objects.create(title='свекла', unit='г'): 1})
+        self.assertEqual(self._search('свеклы'), [self.soup])
+        self.assertEqual(self._search('морковь'), [self.soup])
+        self.assertEqual(self._search('молодая'), [])
+        self.soup.delete()
+        self.assertEqual(self._search('борщ'), [])
+
+    def test_count_follows_changes(self):
+        self.assertEqual(search_index.search('картошка').count(), 2)
+        self._recipe('Картошка в мундире', 'Сварить')
+        self.assertEqual(search_index.search('картошка').count(), 3)
+        self.fried.delete()
+        self.assertEqual(search_index.search('картошка').count(), 2)
+
+    def test_fallback(self):
+        backend = FallbackSearchBackend()
+        # LIKE в SQLite не учитывает регистр только для латиницы
+        self.assertEqual(backend.search(['бульоном'], 0, 10), [self.soup.pk])
+        self.assertEqual(backend.count(['молодая']), 1)
+
+    def test_page(self):
+        for i in range(RECIPES_PER_PAGE + 1):
+            self._recipe(f'Картофельное пюре {i}', 'Пюре')
+        response = self.client.get(reverse('search'), {'q': 'картофельное'})
+        self.assertEqual(len(response.context['page']), RECIPES_PER_PAGE)
+        self.assertEqual(response.context['paginator'].num_pages, 2)
+        response = self.client.get(
+            reverse('search'), {'q': 'картофельное', 'cursor': '2'})
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertContains(response, 'Картофельное пюре')
+        response = self.client.get(reverse('search'), {'q': 'рататуй'})
+        self.assertContains(response, 'Ничего не найдено')
+
+    def test_bad_page(self):
+        for cursor in ('9' * 23, '-1', '²', 'x'):
+            response = self.client.get(
+                reverse('search'), {'q': 'картошка', 'cursor': cursor})
+            self.assertEqual(response.context['page'].number, 1, msg=cursor)
+            self.assertEqual(len(response.context['page']), 2, msg=cursor)
+
+
+class TestCookable(TestCase):
+    """
+    Тесты подбора рецептов по имеющимся продуктам.
+
+    Проверяет порядок по доле имеющихся продуктов, обновление индекса при
+    изменении и удалении рецепта, синхронизацию между процессами через
+    журнал изменений, поиск продуктов без учета регистра, страницу и
+    JSON-ответ.
+    """
+    def setUp(self):
+        cache.clear()
+        cookable_index.invalidate()
+        self.client = Client()
+        self.user = User.objects.create(username='cook')
+        self.client.force_login(self.user)
+        self.egg, self.milk, self.flour, self.salt = (
+            Product.objects.create(title=title, unit='шт')
+            for title in ('яйцо тест', 'молоко тест', 'мука тест',
+                          'соль тест'))
+        self.omelette = self._recipe('Омлет', self.egg, self.milk)
+        self.pancakes = self._recipe(
+            'Блины', self.egg, self.milk, self.flour, self.salt)
+
+    def _recipe(self, name, *products):
+        recipe = Recipe.recipes.create(
+            author=self.user, name=name, description='-', cook_time=10)
+        Ingredient.objects.sync(recipe, {product: 1 for product in products})
+        return recipe
+
+    def _rank(self, *products):
+        return cookable_index.rank([product.pk for product in products])
+
+    def test_rank(self):
+        self.assertEqual(self._rank(self.egg, self.milk), [
+            (self.omelette.pk, 2, 2), (self.pancakes.pk, 2, 4)])
+        self.assertEqual(
+            self._rank(self.flour), [(self.pancakes.pk, 1, 4)])
+        self.assertEqual(self._rank(), [])
+
+    def test_index_updates(self):
+        self._rank()
+        Ingredient.objects.sync(self.omelette, {self.flour: 1})
+        self.assertEqual(self._rank(self.egg), [(self.pancakes.pk, 1, 4)])
+        self.assertEqual(self._rank(self.flour), [
+            (self.omelette.pk, 1, 1), (self.pancakes.pk, 1, 4)])
+        Ingredient.objects.create(
+            recipe=self.omelette, ingredient=self.salt, amount=1)
+        self.assertEqual(self._rank(self.salt), [
+            (self.omelette.pk, 1, 2), (self.pancakes.pk, 1, 4)])
+        self.pancakes.delete()
+        self.assertEqual(self._rank(self.salt), [(self.omelette.pk, 1, 2)])
+
+    def _commit(self):
+        # TestCase не фиксирует транзакцию, поэтому колбэки вызываются вручную
+        callbacks = [func for _, func in connection.run_on_commit]
+        connection.run_on_commit = []
+        for func in callbacks:
+            func()
+
+    def test_change_log(self):
+        # Второй процесс узнает об изменениях только из журнала в кэше
+        other = CookableIndex()
+        other.rank([])
+        Ingredient.objects.filter(recipe=self.omelette).delete()
+        self.assertEqual(other.rank([self.milk.pk]), [
+            (self.omelette.pk, 1, 2), (self.pancakes.pk, 1, 4)])
+        self._commit()
+        self.assertEqual(
+            other.rank([self.milk.pk]), [(self.pancakes.pk, 1, 4)])
+        cache.clear()
+        Ingredient.objects.sync(self.omelette, {self.milk: 1})
+        self.assertEqual(other.rank([self.milk.pk]), [
+            (self.omelette.pk, 1, 1), (self.pancakes.pk, 1, 4)])
+
+    def test_page_and_api(self):
+        query = {'product': ['яйцо тест', 'мука тест']}
+        response = self.client.get(reverse('cookable'), query)
+        self.assertEqual(
+            response.context['recipes'], [self.pancakes, self.omelette])
+        self.assertContains(response, 'Есть 2 из 4 продуктов')
+        self.assertContains(response, 'Не хватает: молоко тест, соль тест')
+        response = self.client.get(reverse('cookable_api'), query)
+        self.assertEqual(response.json()[1], {
+            'id': self.omelette.pk, 'name': 'Омлет', 'covered': 1,
+            'total': 2, 'missing': ['молоко тест']})
+        response = self.client.get(reverse('cookable'))
+        self.assertEqual(response.context['recipes'], [])
+
+    def test_title_case(self):
+        for titles in (['Мука тест'], [' мука ТЕСТ '], ['МУКА ТЕСТ']):
+            self.assertEqual(
+                product_index.ids(titles), [self.flour.pk], msg=titles)
+        Product.objects.create(title='Ёрш тест', unit='шт')
+        self.assertEqual(len(product_index.ids(['ерш тест'])), 1)
+
+
+class TestConditionalGet(TestCase):
+    """
+    Тесты условных запросов к страницам рецептов.
+
+    Проверяет, что повторный запрос с актуальным ETag или Last-Modified
+    получает 304, а изменение рецепта, его ингредиентов, состояния
+    кнопок пользователя или подписчиков автора делает сохраненную копию
+    устаревшей.
+    """
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create(username='author')
+        self.user = User.objects.create(username='reader')
+        self.recipe = Recipe.recipes.create(
+            author=self.author, name='Каша', description='-', cook_time=10)
+        self.url = reverse('recipe', args=[self.recipe.pk])
+
+    def _revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_recipe_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(self._revalidate(self.url, response).status_code, 304)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_recipe_modified(self):
+        response = self.client.get(self.url)
+        self.recipe.name = 'Овсяная каша'
+        self.recipe.save()
+        response = self._revalidate(self.url, response)
+        self.assertContains(response, 'Овсяная каша')
+        Ingredient.objects.create(
+            recipe=self.recipe, amount=1,
+            ingredient=Product.objects.create(title='овсянка', unit='г'))
+        self.assertContains(
+            self._revalidate(self.url, response), 'овсянка')
+
+    def test_viewer_state(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self._revalidate(self.url, response).status_code, 304)
+        Favorite.favorite.add(self.user, self.recipe)
+        response = self._revalidate(self.url, response)
+        self.assertEqual(response.status_code, 200)
+        Subscription.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self._revalidate(self.url, response).status_code, 200)
+
+    def test_listings(self):
+        for url in (reverse('index'), reverse('index') + '?tag=breakfast',
+                    reverse('profile', args=[self.author.pk])):
+            response = self.client.get(url)
+            self.assertEqual(self._revalidate(url, response).status_code, 304)
+        url = reverse('index')
+        response = self.client.get(url)
+        self.recipe.tags.add(Tag.objects.filter(slug='lunch').first())
+        self.assertEqual(self._revalidate(url, response).status_code, 200)
+        response = self.client.get(url + '?tag=lunch&tag=breakfast')
+        self.assertEqual(self._revalidate(
+            url + '?tag=breakfast&tag=lunch', response).status_code, 304)
+
+    def test_profile_followers(self):
+        url = reverse('profile', args=[self.author.pk])
+        self.assertContains(self.client.get(url), 'Подписчиков: 0')
+        self.client.force_login(self.author)
+        response = self.client.get(url)
+        Subscription.objects.create(user=self.user, author=self.author)
+        response = self._revalidate(url, response)
+        self.assertContains(response, 'Подписчиков: 1')
+        self.client.logout()
+        self.assertContains(self.client.get(url), 'Подписчиков: 1')
+
+
+class TestAsyncEndpoints(TestCase):
+    """
+    Тесты асинхронных JSON-представлений под ASGI.
+
+    Проверяет кнопки избранного, покупок и подписок, автодополнение,
+    перенаправление неавторизованного пользователя и учет SQL-запросов
+    из потока sync_to_async в заголовке Server-Timing.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='async-user')
+        self.author = User.objects.create(username='async-author')
+        self.recipe = Recipe.recipes.create(
+            author=self.author, name='Суп', description='-', cook_time=10)
+        self.client = AsyncClient()
+        self.client.force_login(self.user)
+
+    async def _post(self, name, data):
+        response = await self.client.post(
+            reverse(name), data, content_type='application/json')
+        return response.json()
+
+    async def test_buttons(self):
+        data = {'id': self.recipe.pk}
+        self.assertEqual(await self._post('favorite', data),
+                         {'success': 'true'})
+        self.assertEqual(await self._post('favorite', data),
+                         {'success': 'false'})
+        self.assertEqual(await self._post('purchases', data),
+                         {'success': 'true'})
+        self.assertEqual(await self._post(
+            'subscription', {'id': self.author.pk}), {'success': 'true'})
+        state = await sync_to_async(ViewerState.load)(
+            self.user, [self.recipe.pk])
+        self.assertEqual(state.favorites, {self.recipe.pk})
+        self.assertEqual(state.purchases, {self.recipe.pk})
+        for name, pk in (('delete_favorite', self.recipe.pk),
+                         ('delete_purchase', self.recipe.pk),
+                         ('delete_subscription', self.author.pk)):
+            response = await self.client.delete(reverse(name, args=[pk]))
+            self.assertEqual(response.json(), {'success': 'true'})
+        response = await self.client.get(reverse('delete_favorite', args=[
+            self.recipe.pk]))
+        self.assertEqual(response.status_code, 405)
+
+    async def test_ingredients_and_metrics(self):
+        await sync_to_async(product_index.invalidate)()
+        # AsyncClient в Django 3.1 не передает data в строку запроса
+        response = await self.client.get(
+            reverse('ingredients') + '?query=%D0%B0%D0%B1%D1%80')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('title', response.json()[0])
+        self.assertRegex(
+            response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    async def test_not_auth_user(self):
+        response = await AsyncClient().post(
+            reverse('favorite'), {'id': self.recipe.pk},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
+
+    async def test_sync_page(self):
+        # GET той же страницы остается синхронным представлением
+        response = await self.client.get(reverse('favorite'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Избранное')
+
+
+def _read_alias(request):
+    return HttpResponse(router.db_for_read(Recipe))
+
+
+def _write_tag(request):
+    Tag.objects.create(name='новый', slug='new')
+    return _read_alias(request)
+
+
+def _write_session(request):
+    request.session['seen'] = True
+    request.session.save()
+    return _read_alias(request)
+
+
+@override_settings(
+    REPLICA_DATABASES=['replica'], REPLICA_PIN_SECONDS=5,
+    DATABASE_ROUTERS=['foodgram.routers.ReplicaRouter'])
+class TestReplicaRouter(TestCase):
+    """
+    Тесты маршрутизации чтения на реплику.
+
+    Проверяет, что на реплику попадает только чтение из представлений с
+    @read_replica, а после записи пользователь на время закрепляется за
+    основной базой через cookie. Данные для справочников и кэша страниц
+    читаются из основной базы, а ответ, построенный по реплике, не
+    получает ETag.
+    """
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def _call(self, view, method='get', cookies=None):
+        request = getattr(self.factory, method)('/')
+        request.COOKIES.update(cookies or {})
+        request.session = SessionStore()
+        request.user = AnonymousUser()
+        return ReplicaPinMiddleware(view)(request)
+
+    def test_read_replica_views(self):
+        response = self._call(read_replica(_read_alias))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self._call(_read_alias).content, b'default')
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_pin_after_write(self):
+        response = self._call(read_replica(_read_alias), method='post')
+        pin = response.cookies[PIN_COOKIE]
+        self.assertEqual(pin['max-age'], 5)
+        response = self._call(
+            read_replica(_read_alias), cookies={PIN_COOKIE: pin.value})
+        self.assertEqual(response.content, b'default')
+        expired = str(int(time.time()) - 1)
+        response = self._call(
+            read_replica(_read_alias), cookies={PIN_COOKIE: expired})
+        self.assertEqual(response.content, b'replica')
+
+    def test_write_in_get_view(self):
+        response = self._call(read_replica(_write_tag))
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # Сохранение сессии не считается изменением данных пользователя
+        response = self._call(read_replica(_write_session))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_primary(self):
+        def view(request):
+            with primary():
+                return _read_alias(request)
+
+        self.assertEqual(self._call(read_replica(view)).content, b'default')
+
+    def test_refdata_from_primary(self):
+        refdata = RefData('replica', lambda: router.db_for_read(Recipe))
+        self.addCleanup(refdata_registry.pop, 'replica')
+
+        def view(request):
+            return HttpResponse(refdata.get())
+
+        self.assertEqual(self._call(read_replica(view)).content, b'default')
+
+    def test_page_cache_from_primary(self):
+        view = read_replica(anonymous_page_cache(_read_alias))
+        self.assertEqual(self._call(view).content, b'default')
+
+    def test_no_validators_from_replica(self):
+        view = conditional_page(lambda request: 'etag')(_read_alias)
+        response = self._call(read_replica(view))
+        self.assertEqual(response.content, b'replica')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertTrue(self._call(view).has_header('ETag'))
+
+    async def test_async_view(self):
+        async def view(request):
+            return await sync_to_async(_read_alias)(request)
+
+        async def get_response(request):
+            return await read_replica(view)(request)
+
+        request = self.factory.get('/')
+        response = await ReplicaPinMiddleware(get_response)(request)
+        self.assertEqual(response.content, b'replica')
+
+
+@skipUnless('replica' in settings.DATABASES,
+            'Реплика не настроена (DB_REPLICA_NAME или DB_REPLICA_HOST)')
+class TestReplicaDatabase(TransactionTestCase):
+    """
+    Тесты чтения страниц из реплики с настоящим вторым подключением.
+
+    В тестах реплика - зеркало основной базы, поэтому проверяется только,
+    через какое подключение идут запросы.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create(username='replica-user')
+        self.recipe = Recipe.recipes.create(
+            author=self.user, name='Суп', description='-', cook_time=10)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def _replica_queries(self, url):
+        with CaptureQueriesContext(connections['replica']) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_read_your_writes(self):
+        url = reverse('recipe', args=[self.recipe.pk])
+        self.assertGreater(self._replica_queries(url), 0)
+        response = self.client.post(
+            reverse('favorite'), {'id': self.recipe.pk},
+            content_type='application/json')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self._replica_queries(url), 0)
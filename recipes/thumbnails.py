@@ -0,0 +1,313 @@
+import logging
+import multiprocessing
+import os
+from base64 import b64encode
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import serialize, tokey
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+from sorl.thumbnail.parsers import parse_geometry
+
+from .models import Recipe
+from .page_cache import bump_pages_version, mark_uncacheable
+
+
+logger = logging.getLogger(__name__)
+
+# Параметры JPEG, который получают браузеры без WebP
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True, 'quality': 85}
+# Качество современных форматов; AVIF используется, только если его
+# поддерживает установленный Pillow
+PICTURE_FORMATS = {'AVIF': 50, 'WEBP': 75}
+PICTURE_SCALES = (1, 2)
+PLACEHOLDER_SIZE = 16
+
+# Все размеры, которые используют шаблоны
+THUMBNAIL_GEOMETRIES = (
+    '364x240',  # recipe_card_body.html
+    '480x480',  # recipe_detail.html
+    '90x90',  # purchases.html
+    '72x72',  # subscription_card.html
+)
+
+
+def picture_formats():
+    Image.init()
+    return {format_: quality for format_, quality in PICTURE_FORMATS.items()
+            if format_ in Image.SAVE}
+
+
+def picture_variants(geometry_string):
+    """
+    Все варианты изображения для тега {% picture %}.
+
+    Возвращает кортежи (формат или None для JPEG, масштаб, размер,
+    параметры миниатюры) для 1x и 2x каждого формата.
+    """
+    width, height = parse_geometry(geometry_string)
+    formats = picture_formats()
+    for scale in PICTURE_SCALES:
+        geometry = f'{width * scale}x{height * scale}'
+        yield None, scale, geometry, THUMBNAIL_OPTIONS
+        for format_, quality in formats.items():
+            yield format_, scale, geometry, dict(
+                THUMBNAIL_OPTIONS, format=format_, quality=quality)
+
+
+def make_placeholder(file_):
+    """Крошечная размытая копия изображения в виде data URI."""
+    try:
+        with Image.open(file_) as image:
+            image.draft('RGB', (PLACEHOLDER_SIZE * 2, PLACEHOLDER_SIZE * 2))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+    except (OSError, Image.DecompressionBombError):
+        logger.warning('Не удалось прочитать изображение %s', file_)
+        return ''
+    finally:
+        file_.seek(0)
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = BytesIO()
+    image.filter(ImageFilter.GaussianBlur(1)).save(
+        buffer, 'JPEG', quality=40, optimize=True)
+    return 'data:image/jpeg;base64,' + b64encode(buffer.getvalue()).decode()
+
+
+def _init_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    import django
+    django.setup()
+
+
+def pregenerate(name):
+    """Создает все миниатюры изображения; выполняется в фоновом процессе."""
+    backend = NamedThumbnailBackend()
+    for geometry_string in THUMBNAIL_GEOMETRIES:
+        for _, _, geometry, options in picture_variants(geometry_string):
+            backend.get_thumbnail(name, geometry, **options)
+    # Карточки и страницы, отрисованные до миниатюр, больше не подходят
+    Recipe.recipes.filter(image=name).update(modified=timezone.now())
+    bump_pages_version()
+    return name
+
+
+def pregenerate_placeholder(name):
+    """Заглушка уже загруженного изображения; для generate_thumbnails."""
+    with default.storage.open(name) as file_:
+        return name, make_placeholder(file_)
+
+
+class ThumbnailPool:
+    """
+    Пул процессов, в котором создаются миниатюры.
+
+    Процессы запускаются через spawn, чтобы не наследовать соединения с
+    базой данных от воркера веб-сервера. Одно изображение не ставится в
+    очередь повторно, пока предыдущая задача не завершилась.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pending = set()
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return settings.THUMBNAIL_WORKERS > 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker)
+        return self._executor
+
+    def submit(self, name):
+        with self._lock:
+            if name in self._pending:
+                return
+            try:
+                future = self._get_executor().submit(pregenerate, name)
+            except BrokenProcessPool:
+                # Процесс пула упал (например, по памяти): создаем пул заново
+                self._executor = None
+                future = self._get_executor().submit(pregenerate, name)
+            self._pending.add(name)
+        future.add_done_callback(lambda f: self._done(name, f))
+
+    def _done(self, name, future):
+        with self._lock:
+            self._pending.discard(name)
+        if future.exception() is not None:
+            logger.error('Не удалось создать миниатюры для %s', name,
+                         exc_info=future.exception())
+
+
+thumbnail_pool = ThumbnailPool()
+
+
+class ThumbnailKVStore(KVStore):
+    """kvstore sorl-thumbnail, который умеет читать много миниатюр сразу."""
+
+    def get_many(self, names):
+        """
+        Находит уже созданные миниатюры с именами names.
+
+        Читает кэш одним get_many, а отсутствующие в кэше - одним запросом
+        к базе. Промахи не кэшируются: миниатюру может создать пул.
+        """
+        keys = {
+            add_prefix(ImageFile(name, default.storage).key, 'image'): name
+            for name in names}
+        values = self.cache.get_many(list(keys))
+        missing = [key for key in keys if key not in values]
+        if missing:
+            stored = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            self.cache.set_many(
+                stored, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(stored)
+        return {keys[key]: deserialize_image_file(value)
+                for key, value in values.items() if value != EMPTY_VALUE}
+
+
+class NamedThumbnailBackend(ThumbnailBackend):
+    """
+    Бэкенд sorl-thumbnail с предсказуемыми именами миниатюр.
+
+    Имя строится из имени исходного файла, размера и параметров, например
+    cache/recipes/soup_364x240_1a2b3c4d.jpg, и вычисляется без обращения
+    к kvstore и хранилищу.
+    """
+
+    def _normalize_options(self, source, options):
+        # Повторяет подготовку параметров ThumbnailBackend.get_thumbnail
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        stem = os.path.splitext(source.name)[0]
+        digest = tokey(serialize(options))[:8]
+        extension = EXTENSIONS.get(
+            options['format'], options['format'].lower())
+        return (f'{thumbnail_settings.THUMBNAIL_PREFIX}'
+                f'{stem}_{geometry_string}_{digest}.{extension}')
+
+    def thumbnail_name(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        options = self._normalize_options(source, options)
+        return self._get_thumbnail_filename(source, geometry_string, options)
+
+
+def resolve_thumbnails(files, geometry_string):
+    """
+    Находит готовые варианты изображений всех files одним обращением к
+    kvstore.
+
+    Найденная миниатюра запоминается в самом файле (FieldFile), и теги
+    {% picture %} и {% thumbnail %} того же размера берут ее оттуда. Для
+    остальных вариантов теги работают как обычно.
+    """
+    backend = default.backend
+    variants = [(geometry, options) for _, _, geometry, options
+                in picture_variants(geometry_string)]
+    names = {}
+    for file_ in files:
+        if not file_:
+            continue
+        for geometry, options in variants:
+            name = backend.thumbnail_name(file_, geometry, **options)
+            names.setdefault(name, []).append(file_)
+    if not names:
+        return
+    for name, thumbnail in default.kvstore.get_many(names).items():
+        for file_ in names[name]:
+            file_.__dict__.setdefault('_thumbnails', {})[name] = thumbnail
+
+
+def picture_sources(file_, geometry_string):
+    """
+    Адреса вариантов изображения для тега {% picture %}.
+
+    Варианты, которые еще создаются в пуле, пропускаются; пока нет JPEG,
+    img показывает исходное изображение, как и тег {% thumbnail %}.
+    Размеры img всегда берутся из geometry.
+    """
+    backend = default.backend
+    srcsets = {}
+    fallback = None
+    for format_, scale, geometry, options in picture_variants(
+            geometry_string):
+        thumbnail = backend.get_thumbnail(file_, geometry, **options)
+        if format_ is None and scale == 1:
+            fallback = thumbnail
+        if thumbnail.name != file_.name:
+            srcsets.setdefault(format_, []).append(
+                f'{thumbnail.url} {scale}x')
+    jpeg = srcsets.pop(None, [])
+    width, height = parse_geometry(geometry_string)
+    return {
+        'src': fallback.url,
+        'srcset': ', '.join(jpeg) if len(jpeg) > 1 else '',
+        'width': width,
+        'height': height,
+        'sources': [
+            {'type': f'image/{format_.lower()}', 'srcset': ', '.join(urls)}
+            for format_, urls in srcsets.items()],
+    }
+
+
+class PregeneratingThumbnailBackend(NamedThumbnailBackend):
+    """
+    Бэкенд sorl-thumbnail, который никогда не создает миниатюру в запросе.
+
+    Если миниатюры еще нет, ее создание ставится в фоновый пул, а шаблон
+    получает исходное изображение без размеров.
+    Миниатюры, найденные заранее resolve_thumbnails, берутся без запросов.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        name = self.thumbnail_name(file_, geometry_string, **options)
+        resolved = getattr(file_, '_thumbnails', {}).get(name)
+        if resolved is not None:
+            return resolved
+        if not thumbnail_pool.enabled:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        source = ImageFile(file_)
+        thumbnail = ImageFile(name, default.storage)
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        # kvstore запоминает промах в кэше; миниатюру запишет другой
+        # процесс, поэтому промах не кэшируем
+        kv_cache = getattr(default.kvstore, 'cache', None)
+        if kv_cache is not None:
+            kv_cache.delete(add_prefix(thumbnail.key, 'image'))
+        thumbnail_pool.submit(source.name)
+        # HTML с исходным изображением нельзя кэшировать надолго
+        mark_uncacheable(source.name)
+        # Размер исходного изображения неизвестен без чтения файла, поэтому
+        # не задается; обрезает изображение CSS (object-fit: cover)
+        return ImageFile(source.name, source.storage)
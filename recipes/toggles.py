@@ -0,0 +1,125 @@
+from django.db import transaction
+
+from users.models import Subscription
+
+from .conditional import bump_viewer_versions
+from .models import AuthorStats, Favorite, Purchase, Recipe, User
+from .page_cache import bump_pages_version
+from .viewer import ViewerState
+
+
+COLLECTIONS = ('favorites', 'purchases', 'subscriptions')
+ACTIONS = ('add', 'remove')
+MAX_OPERATIONS = 100
+
+
+def parse_operations(data):
+    """
+    Проверяет тело запроса и сворачивает операции.
+
+    Для каждой пары (коллекция, id) остается последнее действие, поэтому
+    серия нажатий на одну кнопку дает одно итоговое состояние. Возвращает
+    {коллекция: {id: True - добавить, False - удалить}}.
+    """
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('Ожидается непустой список operations')
+    if len(operations) > MAX_OPERATIONS:
+        raise ValueError(f'Не больше {MAX_OPERATIONS} операций за запрос')
+    result = {collection: {} for collection in COLLECTIONS}
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError('Операция должна быть объектом')
+        collection = operation.get('collection')
+        action = operation.get('action')
+        item = operation.get('id')
+        if collection not in COLLECTIONS or action not in ACTIONS:
+            raise ValueError(f'Неизвестная операция: {operation}')
+        try:
+            item = int(item)
+        except (TypeError, ValueError):
+            raise ValueError(f'Некорректный id: {item!r}')
+        result[collection][item] = action == 'add'
+    return result
+
+
+def _split(states):
+    added = [item for item, add in states.items() if add]
+    removed = [item for item, add in states.items() if not add]
+    return added, removed
+
+
+def _apply_recipes(manager, user, states):
+    if not states:
+        return
+    added, removed = _split(states)
+    if added:
+        # Строка пользователя заблокирована, поэтому ни одна из найденных
+        # здесь новых пар не появится до вставки
+        existing = manager.filter(
+            user=user, recipe_id__in=added).values_list('recipe_id')
+        recipes = Recipe.recipes.filter(
+            pk__in=added).exclude(pk__in=existing).values_list('pk', flat=True)
+        for recipe in recipes:
+            manager.create(user=user, recipe_id=recipe)
+    if removed:
+        manager.filter(user=user, recipe_id__in=removed).delete()
+
+
+def _apply_subscriptions(user, states):
+    if not states:
+        return
+    added, removed = _split(states)
+    # Строка пользователя заблокирована, поэтому новые подписки, найденные
+    # до вставки, и есть вставленные
+    authors = set(User.objects.filter(
+        pk__in=added
+    ).exclude(pk=user.pk).values_list('pk', flat=True)) - set(
+        Subscription.objects.filter(
+            user=user, author_id__in=added
+        ).values_list('author_id', flat=True))
+    Subscription.objects.bulk_create(
+        (Subscription(user=user, author_id=author) for author in authors),
+        ignore_conflicts=True)
+    # bulk_create не отправляет post_save
+    bump_viewer_versions([user.pk])
+    AuthorStats.objects.shift('followers_count', dict.fromkeys(authors, 1))
+    AuthorStats.objects.shift('following_count', {user.pk: len(authors)})
+    if removed:
+        Subscription.objects.filter(
+            user=user, author_id__in=removed).delete()
+    # Шапки профилей показывают число подписчиков и подписок
+    bump_pages_version()
+
+
+def apply_operations(user, operations):
+    """
+    Применяет свернутые операции в одной транзакции и возвращает состояние.
+
+    Строка пользователя блокируется на время транзакции, поэтому
+    параллельные запросы одного пользователя не вставляют одну и ту же
+    пару дважды.
+    """
+    with transaction.atomic():
+        list(User.objects.select_for_update().filter(
+            pk=user.pk).values_list('pk', flat=True))
+        _apply_recipes(Favorite.favorite, user, operations['favorites'])
+        _apply_recipes(Purchase.purchase, user, operations['purchases'])
+        _apply_subscriptions(user, operations['subscriptions'])
+    recipes = set(operations['favorites']) | set(operations['purchases'])
+    viewer = ViewerState.load(user, recipes)
+    subscribed = set(Subscription.objects.filter(
+        user=user, author_id__in=list(operations['subscriptions'])
+    ).values_list('author_id', flat=True))
+    return {
+        'favorites': {
+            item: item in viewer.favorites
+            for item in operations['favorites']},
+        'purchases': {
+            item: item in viewer.purchases
+            for item in operations['purchases']},
+        'subscriptions': {
+            item: item in subscribed
+            for item in operations['subscriptions']},
+        'purchase_counter': Purchase.purchase.counter(user),
+    }
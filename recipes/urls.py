@@ -1,12 +1,16 @@
 from django.urls import path
 
 from . import views
+from .decorators import method_dispatch
 
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('profile/<int:user_id>', views.profile, name='profile'),
-    path('favorites', views.FavoriteView.as_view(), name='favorite'),
+    path('search', views.search, name='search'),
+    path('favorites', method_dispatch(
+        get=views.FavoriteView.as_view(), post=views.add_favorite),
+        name='favorite'),
     path('favorites/<int:recipe_id>', views.delete_favorite,
          name='delete_favorite'),
     path('my_subscriptions', views.get_subscriptions, name='my_subscriptions'),
@@ -20,9 +24,14 @@ urlpatterns = [
          name='edit_recipe'),
     path('recipes/<int:recipe_id>/delete', views.delete_recipe,
          name='delete_recipe'),
-    path('purchases', views.PurchaseView.as_view(), name='purchases'),
+    path('purchases', method_dispatch(
+        get=views.PurchaseView.as_view(), post=views.add_purchase),
+        name='purchases'),
     path('purchases/<int:recipe_id>', views.delete_purchase,
          name='delete_purchase'),
+    path('toggles', views.toggles, name='toggles'),
     path('shoplist', views.send_shop_list, name='shop-list'),
     path('ingredients', views.get_ingredients, name='ingredients'),
+    path('cookable', views.cookable, name='cookable'),
+    path('cookable/api', views.cookable_api, name='cookable_api'),
 ]
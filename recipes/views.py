@@ -1,25 +1,44 @@
 import json
 from urllib.parse import unquote
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.paginator import Paginator
-from django.db.models import Sum
-from django.http import HttpResponse, JsonResponse
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.decorators import method_decorator
 from django.views import View
-from django.views.decorators.http import (require_GET, require_http_methods,
-                                          require_POST)
+from django.views.decorators.http import require_GET, require_http_methods
+
+from foodgram.routers import read_replica
 from users.models import Subscription
 
+from .autocomplete import product_index
+from .conditional import (conditional_page, listing_etag, profile_etag,
+                          recipe_etag, recipe_last_modified)
+from .cookable import cookable_recipes
+from .decorators import async_login_required, async_require_http_methods
 from .forms import RecipeForm
-from .models import Favorite, Ingredient, Product, Purchase, Recipe, Tag, User
+from .models import (Favorite, Ingredient, Purchase, Recipe, ShoppingListItem,
+                     Tag, User)
+from .page_cache import anonymous_page_cache
+from .paginator import KeysetPaginator, SearchPaginator
+from .search import search_index
+from .thumbnails import resolve_thumbnails
+from .toggles import apply_operations, parse_operations
+from .viewer import ViewerState
+
 
+RECIPES_PER_PAGE = 6
+SUBSCRIPTION_PREVIEWS = 3
 
-def _extend_context(context, user):
-    context['purchase_list'] = Purchase.purchase.get_purchases_list(user)
-    context['favorites'] = Favorite.favorite.get_favorites(user)
+
+def _extend_context(context, user, recipes):
+    context['viewer'] = ViewerState.load(
+        user, [recipe.id for recipe in recipes])
     return context
 
 
@@ -30,35 +49,41 @@ def _add_subscription_status(context, user, author):
     return context
 
 
+@read_replica
 @require_GET
+@conditional_page(listing_etag)
+@anonymous_page_cache
 def index(request):
     tags = request.GET.getlist('tag')
     recipe_list = Recipe.recipes.tag_filter(tags)
-    paginator = Paginator(recipe_list, 6)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(recipe_list, RECIPES_PER_PAGE)
+    page = paginator.get_page(request.GET.get('cursor'))
     context = {
-        'all_tags': Tag.objects.all(),
+        'all_tags': Tag.objects.cached(),
         'page': page,
         'paginator': paginator
     }
     user = request.user
     if user.is_authenticated:
         context['active'] = 'recipe'
-        _extend_context(context, user)
+        _extend_context(context, user, page)
     return render(request, 'index.html', context)
 
 
+@read_replica
 @require_GET
+@conditional_page(profile_etag)
+@anonymous_page_cache
 def profile(request, user_id):
-    profile = get_object_or_404(User, id=user_id)
+    profile = get_object_or_404(
+        User.objects.select_related('author_stats'), id=user_id)
     tags = request.GET.getlist('tag')
     recipes_list = Recipe.recipes.tag_filter(tags)
-    paginator = Paginator(recipes_list.filter(author=profile), 6)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(
+        recipes_list.filter(author=profile), RECIPES_PER_PAGE)
+    page = paginator.get_page(request.GET.get('cursor'))
     context = {
-        'all_tags': Tag.objects.all(),
+        'all_tags': Tag.objects.cached(),
         'profile': profile,
         'page': page,
         'paginator': paginator
@@ -68,23 +93,48 @@ def profile(request, user_id):
     user = request.user
     if user.is_authenticated:
         _add_subscription_status(context, user, profile)
-        _extend_context(context, user)
+        _extend_context(context, user, page)
     return render(request, 'profile.html', context)
 
 
+@read_replica
 @require_GET
+@conditional_page(recipe_etag, recipe_last_modified)
+@anonymous_page_cache
 def recipe_detail(request, recipe_id):
-    recipe = get_object_or_404(Recipe, id=recipe_id)
+    recipe = get_object_or_404(
+        Recipe.recipes.select_related('author').prefetch_related(
+            'tags', Prefetch(
+                'ingredient_set',
+                queryset=Ingredient.objects.select_related('ingredient'))),
+        id=recipe_id)
+    resolve_thumbnails([recipe.image], '480x480')
     context = {
         'recipe': recipe,
     }
     user = request.user
     if user.is_authenticated:
         _add_subscription_status(context, user, recipe.author)
-        _extend_context(context, user)
+        _extend_context(context, user, [recipe])
     return render(request, 'recipe_detail.html', context)
 
 
+@require_GET
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(
+        search_index.search(query), RECIPES_PER_PAGE)
+    page = paginator.get_page(request.GET.get('cursor'))
+    context = {
+        'active': 'search',
+        'query': query,
+        'page': page,
+        'paginator': paginator,
+    }
+    _extend_context(context, request.user, page)
+    return render(request, 'search.html', context)
+
+
 class FavoriteView(View):
     model = Favorite
 
@@ -99,60 +149,64 @@ class FavoriteView(View):
         return queryset
 
     def get(self, request):
-        paginator = Paginator(self.get_queryset(), 6)
-        page_number = request.GET.get('page')
-        page = paginator.get_page(page_number)
-        purchase_list = Purchase.purchase.get_purchases_list(request.user)
+        paginator = KeysetPaginator(self.get_queryset(), RECIPES_PER_PAGE)
+        page = paginator.get_page(request.GET.get('cursor'))
         context = {
-            'all_tags': Tag.objects.all(),
-            'purchase_list': purchase_list,
+            'all_tags': Tag.objects.cached(),
             'active': 'favorite',
             'paginator': paginator,
             'page': page
         }
+        _extend_context(context, request.user, page)
         return render(request, 'favorites.html', context)
 
-    def post(self, request):
-        json_data = json.loads(request.body.decode())
-        recipe_id = json_data['id']
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        data = {'success': 'true'}
-        favorite = Favorite.favorite.get_user(request.user)
-        is_favorite = favorite.recipes.filter(id=recipe_id).exists()
-        if is_favorite:
-            data['success'] = 'false'
-        else:
-            favorite.recipes.add(recipe)
-        return JsonResponse(data)
+
+def _add_favorite(user, recipe_id):
+    recipe = get_object_or_404(Recipe, id=recipe_id)
+    added = Favorite.favorite.add(user, recipe)
+    return {'success': 'true' if added else 'false'}
 
 
-@login_required(login_url='auth/login/')
-@require_http_methods('DELETE')
-def delete_favorite(request, recipe_id):
+@async_login_required()
+@async_require_http_methods(['POST'])
+async def add_favorite(request):
+    json_data = json.loads(request.body.decode())
+    data = await sync_to_async(_add_favorite)(request.user, json_data['id'])
+    return JsonResponse(data)
+
+
+def _delete_favorite(user, recipe_id):
     recipe = get_object_or_404(Recipe, id=recipe_id)
-    data = {'success': 'true'}
-    try:
-        favorite = Favorite.favorite.get(user=request.user)
-    except ObjectDoesNotExist:
-        data['success'] = 'false'
-    if not favorite.recipes.filter(id=recipe_id).exists():
-        data['success'] = 'false'
-    favorite.recipes.remove(recipe)
+    removed = Favorite.favorite.remove(user, recipe)
+    return {'success': 'true' if removed else 'false'}
+
+
+@async_login_required(login_url='auth/login/')
+@async_require_http_methods(['DELETE'])
+async def delete_favorite(request, recipe_id):
+    data = await sync_to_async(_delete_favorite)(request.user, recipe_id)
     return JsonResponse(data)
 
 
+@read_replica
 @login_required(login_url='auth/login/')
 @require_GET
 def get_subscriptions(request):
-    try:
-        subscriptions = Subscription.objects.filter(
-            user=request.user
-        ).order_by('pk')
-    except ObjectDoesNotExist:
-        subscriptions = []
+    subscriptions = Subscription.objects.filter(
+        user=request.user
+    ).select_related('author').annotate(
+        recipes_count=Coalesce(F('author__author_stats__recipes_count'), 0)
+    ).order_by('pk')
     page_num = request.GET.get('page')
     paginator = Paginator(subscriptions, 6)
     page = paginator.get_page(page_num)
+    previews = Recipe.recipes.latest_by_authors(
+        [card.author_id for card in page], SUBSCRIPTION_PREVIEWS)
+    for card in page:
+        card.previews = previews[card.author_id]
+        card.more_count = max(card.recipes_count - SUBSCRIPTION_PREVIEWS, 0)
+    resolve_thumbnails(
+        [recipe.image for card in page for recipe in card.previews], '72x72')
     context = {
         'active': 'subscription',
         'paginator': paginator,
@@ -161,31 +215,41 @@ def get_subscriptions(request):
     return render(request, 'subscriptions.html', context)
 
 
-@login_required(login_url='auth/login/')
-@require_POST
-def subscription(request):
-    json_data = json.loads(request.body.decode())
-    author = get_object_or_404(User, id=json_data['id'])
+def _subscribe(user, author_id):
+    author = get_object_or_404(User, id=author_id)
     is_exist = Subscription.objects.filter(
-        user=request.user, author=author).exists()
+        user=user, author=author).exists()
     data = {'success': 'true'}
     if is_exist:
         data['success'] = 'false'
     else:
-        Subscription.objects.create(user=request.user, author=author)
+        Subscription.objects.create(user=user, author=author)
+    return data
+
+
+@async_login_required(login_url='auth/login/')
+@async_require_http_methods(['POST'])
+async def subscription(request):
+    json_data = json.loads(request.body.decode())
+    data = await sync_to_async(_subscribe)(request.user, json_data['id'])
     return JsonResponse(data)
 
 
-@login_required(login_url='auth/login/')
-@require_http_methods('DELETE')
-def delete_subscription(request, author_id):
+def _unsubscribe(user, author_id):
     author = get_object_or_404(User, id=author_id)
     data = {'success': 'true'}
     follow = Subscription.objects.filter(
-        user=request.user, author=author)
+        user=user, author=author)
     if not follow:
         data['success'] = 'false'
     follow.delete()
+    return data
+
+
+@async_login_required(login_url='auth/login/')
+@async_require_http_methods(['DELETE'])
+async def delete_subscription(request, author_id):
+    data = await sync_to_async(_unsubscribe)(request.user, author_id)
     return JsonResponse(data)
 
 
@@ -201,63 +265,78 @@ class PurchaseView(View):
         return queryset
 
     def get(self, request):
-        recipes_list = self.get_queryset()
+        recipes_list = list(self.get_queryset())
+        resolve_thumbnails([recipe.image for recipe in recipes_list], '90x90')
         context = {
             'recipes_list': recipes_list,
             'active': 'purchase'
         }
         return render(request, 'purchases.html', context)
 
-    def post(self, request):
-        json_data = json.loads(request.body.decode())
-        recipe_id = json_data['id']
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        purchase = Purchase.purchase.get_user_purchase(user=request.user)
-        data = {
-            'success': 'true'
-        }
-        if not purchase.recipes.filter(id=recipe_id).exists():
-            purchase.recipes.add(recipe)
-            return JsonResponse(data)
-        data['success'] = 'false'
-        return JsonResponse(data)
 
+def _add_purchase(user, recipe_id):
+    recipe = get_object_or_404(Recipe, id=recipe_id)
+    added = Purchase.purchase.add(user, recipe)
+    return {'success': 'true' if added else 'false'}
 
-@login_required(login_url='auth/login/')
-@require_http_methods('DELETE')
-def delete_purchase(request, recipe_id):
+
+@async_login_required()
+@async_require_http_methods(['POST'])
+async def add_purchase(request):
+    json_data = json.loads(request.body.decode())
+    data = await sync_to_async(_add_purchase)(request.user, json_data['id'])
+    return JsonResponse(data)
+
+
+def _delete_purchase(user, recipe_id):
     recipe = get_object_or_404(Recipe, id=recipe_id)
-    data = {
-        'success': 'true'
-    }
-    try:
-        purchase = Purchase.purchase.get(user=request.user)
-    except ObjectDoesNotExist:
-        data['success'] = 'false'
-    if not purchase.recipes.filter(id=recipe_id).exists():
-        data['success'] = 'false'
-    purchase.recipes.remove(recipe)
+    removed = Purchase.purchase.remove(user, recipe)
+    return {'success': 'true' if removed else 'false'}
+
+
+@async_login_required(login_url='auth/login/')
+@async_require_http_methods(['DELETE'])
+async def delete_purchase(request, recipe_id):
+    data = await sync_to_async(_delete_purchase)(request.user, recipe_id)
     return JsonResponse(data)
 
 
+@async_login_required()
+@async_require_http_methods(['POST'])
+async def toggles(request):
+    # Пакет операций с избранным, покупками и подписками
+    try:
+        operations = parse_operations(json.loads(request.body.decode()))
+    except ValueError as error:
+        return JsonResponse(
+            {'success': 'false', 'error': str(error)}, status=400)
+    state = await sync_to_async(apply_operations)(request.user, operations)
+    return JsonResponse({'success': 'true', **state})
+
+
+@read_replica
 @login_required(login_url='auth/login/')
 @require_GET
 def send_shop_list(request):
     user = request.user
-    ingredients = Ingredient.objects.select_related(
-        'ingredient'
-    ).filter(
-        recipe__purchase__user=user
-    ).values(
-        'ingredient__title', 'ingredient__unit'
-    ).annotate(total=Sum('amount'))
+    items = ShoppingListItem.objects.filter(
+        user=user
+    ).order_by(
+        'product__title'
+    ).values_list(
+        'product__title', 'product__unit', 'amount')
+    # Строки читаются после выхода из представления: база выбирается сейчас
+    items = items.using(items.db)
     filename = f'{user.username}_list.txt'
-    products = [
-        (f'+ {i["ingredient__title"]} ({i["ingredient__unit"]}) -'
-         f' {i["total"]}')
-        for i in ingredients]
-    content = '  Продукт (единицы) - количество \n \n' + '\n'.join(products)
-    response = HttpResponse(content, content_type='text/plain')
+
+    def lines():
+        yield '  Продукт (единицы) - количество \n \n'
+        separator = ''
+        for title, unit, amount in items.iterator():
+            yield f'{separator}+ {title} ({unit}) - {amount}'
+            separator = '\n'
+
+    response = StreamingHttpResponse(lines(), content_type='text/plain')
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
 
@@ -283,30 +362,49 @@ def new_recipe(request):
             return render(request, 'recipe_form.html', context)
         recipe = form.save(commit=False)
         recipe.author = request.user
-        form.save()
-        ingedient_names = request.POST.getlist('nameIngredient')
-        ingredient_units = request.POST.getlist('unitsIngredient')
-        amounts = request.POST.getlist('valueIngredient')
-        products = [Product.objects.get(
-            title=ingedient_names[i],
-            unit=ingredient_units[i]
-        ) for i in range(len(ingedient_names))]
-        ingredients = []
-        for i in range(len(amounts)):
-            ingredients.append(Ingredient(
-                recipe=recipe, ingredient=products[i], amount=amounts[i]))
-        Ingredient.objects.bulk_create(ingredients)
+        with transaction.atomic():
+            form.save()
+            Ingredient.objects.sync(recipe, form.cleaned_data['ingredients'])
         return redirect('index')
 
 
-@login_required(login_url='auth/login/')
+@read_replica
+@async_login_required(login_url='auth/login/')
+@async_require_http_methods(['GET'])
+async def get_ingredients(request):
+    query = unquote(request.GET.get('query', ''))
+    # Индекс строится из базы только при первом запросе процесса
+    data = await sync_to_async(product_index.search)(query)
+    return JsonResponse(data, safe=False)
+
+
+@login_required
+@require_GET
+def cookable(request):
+    products = request.GET.getlist('product')
+    recipes = cookable_recipes(products)
+    resolve_thumbnails([recipe.image for recipe in recipes], '364x240')
+    context = {
+        'active': 'cookable',
+        'products': products,
+        'recipes': recipes,
+    }
+    _extend_context(context, request.user, recipes)
+    return render(request, 'cookable.html', context)
+
+
+@login_required
 @require_GET
-def get_ingredients(request):
-    query = unquote(request.GET.get('query'))
-    data = list(Product.objects.filter(
-        title__startswith=query
-    ).values(
-        'title', 'unit'))
+def cookable_api(request):
+    data = [
+        {
+            'id': recipe.id,
+            'name': recipe.name,
+            'covered': recipe.covered,
+            'total': recipe.total,
+            'missing': recipe.missing,
+        }
+        for recipe in cookable_recipes(request.GET.getlist('product'))]
     return JsonResponse(data, safe=False)
 
 
@@ -331,20 +429,9 @@ def edit_recipe(request, recipe_id):
         if not form.is_valid():
             context['form'] = form
             return render(request, 'recipe_form.html', context)
-        form.save()
-        new_titles = request.POST.getlist('nameIngredient')
-        new_units = request.POST.getlist('unitsIngredient')
-        amounts = request.POST.getlist('valueIngredient')
-        products_num = len(new_titles)
-        new_ingredients = []
-        Ingredient.objects.filter(recipe__id=recipe_id).delete()
-        for i in range(products_num):
-            product = Product.objects.get(
-                title=new_titles[i], unit=new_units[i])
-            new_ingredients.append(Ingredient(recipe=recipe,
-                                              ingredient=product,
-                                              amount=amounts[i]))
-        Ingredient.objects.bulk_create(new_ingredients)
+        with transaction.atomic():
+            form.save()
+            Ingredient.objects.sync(recipe, form.cleaned_data['ingredients'])
         return redirect('index')
 
 
@@ -1,5 +1,8 @@
 from django import template
 
+from recipes.card_cache import attach_fragments
+from recipes.thumbnails import picture_sources
+
 
 register = template.Library()
 
@@ -11,6 +14,17 @@ def url_with_get(request, page):
     return query.urlencode()
 
 
+@register.filter
+def url_with_cursor(request, cursor):
+    query = request.GET.copy()
+    query.pop('page', None)
+    if cursor:
+        query['cursor'] = cursor
+    else:
+        query.pop('cursor', None)
+    return query.urlencode()
+
+
 @register.filter
 def add_color(tag):
     colors = {
@@ -18,7 +32,8 @@ def add_color(tag):
         'lunch': 'green',
         'dinner': 'purple'
     }
-    return colors[tag.slug]
+    # Теги, добавленные в админке или seed_data, получают общий цвет
+    return colors.get(tag.slug, 'green')
 
 
 @register.filter
@@ -46,3 +61,19 @@ def renew_tag_link(request, tag):
     else:
         request_copy.appendlist('tag', tag.slug)
     return request_copy.urlencode()
+
+
+@register.simple_tag
+def card_fragments(cards):
+    return attach_fragments(cards)
+
+
+@register.inclusion_tag('picture.html')
+def picture(recipe, geometry, css='', width=None, lazy=True):
+    """Изображение рецепта в WebP/AVIF 1x/2x с JPEG и размытой заглушкой."""
+    context = {'recipe': recipe, 'css': css, 'lazy': lazy}
+    if recipe.image:
+        context.update(picture_sources(recipe.image, geometry))
+        if width is not None:
+            context['width'] = width
+    return context